@@ -0,0 +1,389 @@
+"""Aggregate views kept up to date incrementally by triggers.
+
+An :class:`AggregateView` is backed by a summary table rather than a view.
+Statement-level triggers on the source table fold every insert, update and
+delete into the summary, so maintaining it costs as much as the change
+rather than a scan of the whole source table.
+
+Requires Postgres 10 or later, for trigger transition tables.
+"""
+import time
+
+from django.apps import apps
+from django.core import exceptions
+from django.db import connections, router, transaction
+
+from django_pgviews.db.batch import StatementBatch
+from django_pgviews.introspection import get_view_states, split_view_name
+from django_pgviews.signals import view_refreshed
+from django_pgviews.tracing import trace
+from django_pgviews.view import (
+    BaseManagerMeta, FINGERPRINT_PREFIX, ReadOnlyView, RebuildPlan,
+    view_fingerprint)
+
+
+# Hidden column counting the source rows in each group, so empty groups can
+# be removed.
+ROWS_COLUMN = 'pgviews_rows'
+
+
+class Measure(object):
+    """An aggregate computed over each group of an :class:`AggregateView`.
+    """
+    function = None
+
+    def __init__(self, field=None):
+        self.field = field
+
+    def select_sql(self, column):
+        """Aggregate ``column`` over a group of rows.
+        """
+        return '{0}({1})'.format(self.function, column)
+
+    def combine_sql(self, name):
+        """Merge an aggregate of new rows into the summary row ``s``.
+        """
+        raise NotImplementedError
+
+    def subtract_sql(self, name):
+        """Remove an aggregate of old rows ``d`` from the summary row ``s``.
+
+        Returns None if the measure must be recomputed instead.
+        """
+        raise NotImplementedError
+
+
+class Count(Measure):
+    """Count the rows in each group, or the non-null values of ``field``.
+    """
+    function = 'count'
+
+    def select_sql(self, column):
+        return 'count({0})'.format(column or '*')
+
+    def combine_sql(self, name):
+        return 's.{0} + EXCLUDED.{0}'.format(name)
+
+    def subtract_sql(self, name):
+        return 's.{0} - d.{0}'.format(name)
+
+
+class Sum(Measure):
+    """Sum ``field`` over each group, counting nulls as zero.
+    """
+    function = 'sum'
+
+    def select_sql(self, column):
+        return 'COALESCE(sum({0}), 0)'.format(column)
+
+    def combine_sql(self, name):
+        return 's.{0} + EXCLUDED.{0}'.format(name)
+
+    def subtract_sql(self, name):
+        return 's.{0} - d.{0}'.format(name)
+
+
+class Min(Measure):
+    """The smallest value of ``field`` in each group.
+    """
+    function = 'min'
+
+    def combine_sql(self, name):
+        return 'LEAST(s.{0}, EXCLUDED.{0})'.format(name)
+
+    def subtract_sql(self, name):
+        return None
+
+
+class Max(Measure):
+    """The largest value of ``field`` in each group.
+    """
+    function = 'max'
+
+    def combine_sql(self, name):
+        return 'GREATEST(s.{0}, EXCLUDED.{0})'.format(name)
+
+    def subtract_sql(self, name):
+        return None
+
+
+class AggregateSQL(object):
+    """The SQL that creates and maintains the summary table of a view.
+    """
+    def __init__(self, view_cls):
+        try:
+            source = apps.get_model(view_cls.source)
+        except (LookupError, ValueError):
+            raise exceptions.ImproperlyConfigured(
+                '{0}.source must be an installed model, got {1!r}'.format(
+                    view_cls.__name__, view_cls.source))
+        self.table = view_cls._meta.db_table
+        self.source = source._meta.db_table
+
+        self.keys = []
+        for field_name in view_cls.group_by:
+            field = source._meta.get_field(field_name)
+            if field.null:
+                raise exceptions.ImproperlyConfigured(
+                    '{0} can only group by non-null fields, {1} is '
+                    'nullable'.format(view_cls.__name__, field_name))
+            self.keys.append(field.column)
+
+        self.measures = []
+        for name, measure in sorted(view_cls.measures.items()):
+            column = None
+            if measure.field is not None:
+                column = source._meta.get_field(measure.field).column
+            self.measures.append((name, measure, column))
+
+        vschema, vname = split_view_name(self.table)
+        self.function = '{0}.{1}'.format(vschema, _truncate(vname, '_pgviews_sync'))
+        # Leave room for the longest trigger suffix.
+        self.trigger_prefix = ('pgviews_' + vname)[:63 - len('_truncate')]
+
+    def select(self, rows):
+        """Aggregate ``rows`` into one row per group.
+        """
+        columns = self.keys + ['count(*) AS {0}'.format(ROWS_COLUMN)] + [
+            '{0} AS {1}'.format(measure.select_sql(column), name)
+            for name, measure, column in self.measures]
+        return 'SELECT {0} FROM {1} GROUP BY {2} ORDER BY {2}'.format(
+            ', '.join(columns), rows, ', '.join(self.keys))
+
+    def _match(self, left, right):
+        return ' AND '.join(
+            '{0}.{2} = {1}.{2}'.format(left, right, key) for key in self.keys)
+
+    def _recomputed(self):
+        return [
+            (name, measure, column) for name, measure, column in self.measures
+            if measure.subtract_sql(name) is None]
+
+    def apply_new_rows(self):
+        """Fold the aggregates of ``new_rows`` into the summary table.
+        """
+        updates = ['{0} = s.{0} + EXCLUDED.{0}'.format(ROWS_COLUMN)] + [
+            '{0} = {1}'.format(name, measure.combine_sql(name))
+            for name, measure, column in self.measures]
+        return (
+            'INSERT INTO {0} AS s {1} ON CONFLICT ({2}) '
+            'DO UPDATE SET {3};').format(
+                self.table, self.select('new_rows'), ', '.join(self.keys),
+                ', '.join(updates))
+
+    def apply_old_rows(self):
+        """Remove the aggregates of ``old_rows`` from the summary table.
+        """
+        updates = ['{0} = s.{0} - d.{0}'.format(ROWS_COLUMN)] + [
+            '{0} = {1}'.format(name, measure.subtract_sql(name))
+            for name, measure, column in self.measures
+            if measure.subtract_sql(name) is not None]
+        groups = 'SELECT DISTINCT {0} FROM old_rows'.format(
+            ', '.join(self.keys))
+        statements = [
+            'UPDATE {0} AS s SET {1} FROM ({2}) AS d WHERE {3};'.format(
+                self.table, ', '.join(updates), self.select('old_rows'),
+                self._match('s', 'd')),
+            'DELETE FROM {0} AS s USING ({1}) AS d '
+            'WHERE {2} AND s.{3} <= 0;'.format(
+                self.table, groups, self._match('s', 'd'), ROWS_COLUMN),
+        ]
+        recomputed = self._recomputed()
+        if recomputed:
+            # Minimums and maximums can't be undone, so recompute them for
+            # the groups that lost rows.
+            columns = ['src.{0}'.format(key) for key in self.keys] + [
+                '{0} AS {1}'.format(
+                    measure.select_sql('src.' + column), name)
+                for name, measure, column in recomputed]
+            statements.append(
+                'UPDATE {0} AS s SET {1} FROM ('
+                'SELECT {2} FROM {3} AS src JOIN ({4}) AS d ON {5} '
+                'GROUP BY {6}) AS r WHERE {7};'.format(
+                    self.table,
+                    ', '.join('{0} = r.{0}'.format(name)
+                              for name, measure, column in recomputed),
+                    ', '.join(columns), self.source, groups,
+                    self._match('src', 'd'),
+                    ', '.join('src.' + key for key in self.keys),
+                    self._match('s', 'r')))
+        return '\n'.join(statements)
+
+    def create_statements(self):
+        """Return the statements creating the summary table and triggers.
+
+        The triggers are created before the table is filled. Creating them
+        locks the source table against writes until the transaction ends, so
+        no change can be missed.
+        """
+        function = (
+            "CREATE FUNCTION {0}() RETURNS trigger LANGUAGE plpgsql AS "
+            "$pgviews$\n"
+            "BEGIN\n"
+            "IF TG_OP = 'TRUNCATE' THEN\n"
+            "DELETE FROM {1};\n"
+            "RETURN NULL;\n"
+            "END IF;\n"
+            "IF TG_OP IN ('DELETE', 'UPDATE') THEN\n{2}\nEND IF;\n"
+            "IF TG_OP IN ('INSERT', 'UPDATE') THEN\n{3}\nEND IF;\n"
+            "RETURN NULL;\n"
+            "END;\n"
+            "$pgviews$;").format(
+                self.function, self.table, self.apply_old_rows(),
+                self.apply_new_rows())
+        trigger = (
+            'CREATE TRIGGER {0}_{1} AFTER {2} ON {3} {4}'
+            'FOR EACH STATEMENT EXECUTE PROCEDURE {5}();')
+        transitions = [
+            ('insert', 'INSERT', 'REFERENCING NEW TABLE AS new_rows '),
+            ('update', 'UPDATE',
+             'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '),
+            ('delete', 'DELETE', 'REFERENCING OLD TABLE AS old_rows '),
+            ('truncate', 'TRUNCATE', ''),
+        ]
+        return [
+            'CREATE TABLE {0} AS {1} WITH NO DATA;'.format(
+                self.table, self.select(self.source)),
+            'CREATE UNIQUE INDEX ON {0} ({1});'.format(
+                self.table, ', '.join(self.keys)),
+            function,
+        ] + [
+            trigger.format(
+                self.trigger_prefix, suffix, event, self.source, referencing,
+                self.function)
+            for suffix, event, referencing in transitions
+        ] + [
+            'INSERT INTO {0} {1};'.format(self.table, self.select(self.source)),
+        ]
+
+    def drop_function(self):
+        """Return the statement dropping the trigger function, and with it
+        the triggers.
+        """
+        return 'DROP FUNCTION IF EXISTS {0}() CASCADE;'.format(self.function)
+
+    def drop_statements(self):
+        return [
+            'DROP TABLE IF EXISTS {0} CASCADE;'.format(self.table),
+            self.drop_function(),
+        ]
+
+
+def _truncate(name, suffix):
+    """Append ``suffix`` to ``name``, keeping within the identifier limit.
+    """
+    return name[:63 - len(suffix)] + suffix
+
+
+def create_aggregate_view(connection, view_cls, update=True, snapshot=None,
+        batch=None, plan=None):
+    """
+    Create the summary table and triggers of an :class:`AggregateView`.
+
+    Returns ``CREATED`` or ``UPDATED`` if the table was (re)built and filled,
+    or ``EXISTS`` or ``UNCHANGED`` if nothing was done. ``snapshot``,
+    ``batch`` and ``plan`` are as for
+    :func:`~django_pgviews.view.create_view`.
+    """
+    if batch is None:
+        with transaction.atomic(using=connection.alias), \
+                connection.cursor() as cursor:
+            return create_aggregate_view(
+                connection, view_cls, update=update, snapshot=snapshot,
+                batch=StatementBatch(cursor), plan=plan)
+    if plan is None:
+        plan = RebuildPlan()
+
+    sql = AggregateSQL(view_cls)
+    statements = sql.create_statements()
+    fingerprint = view_fingerprint(
+        '\n'.join(statements),
+        columns=[f.column for f in view_cls._meta.concrete_fields])
+
+    if snapshot is None:
+        batch.flush()
+        snapshot = get_view_states(batch.cursor, [sql.table])
+    state = snapshot.get(sql.table)
+    if state is not None and not update:
+        return 'EXISTS'
+    elif state is not None and state.comment == FINGERPRINT_PREFIX + fingerprint:
+        return 'UNCHANGED'
+
+    if state is not None:
+        plan.drop(batch, sql.table, state.kind)
+    for statement in [sql.drop_function()] + statements:
+        batch.execute(statement)
+    batch.execute('COMMENT ON TABLE {0} IS %s;'.format(sql.table),
+                  [FINGERPRINT_PREFIX + fingerprint])
+    plan.created(batch, sql.table)
+    return state is not None and 'UPDATED' or 'CREATED'
+
+
+def clear_aggregate_view(connection, view_cls):
+    """
+    Remove the summary table and triggers of an :class:`AggregateView`.
+    """
+    with connection.cursor() as cursor:
+        for statement in AggregateSQL(view_cls).drop_statements():
+            cursor.execute(statement)
+    return u'DROPPED'
+
+
+class _AggregateQuery(object):
+    """Make ``sql`` the query computing the whole summary from scratch.
+    """
+    def __get__(self, instance, owner):
+        if getattr(owner, 'source', None) is None:
+            raise AttributeError('sql')
+        sql = AggregateSQL(owner)
+        return sql.select(sql.source)
+
+
+class AggregateView(ReadOnlyView):
+    """An aggregate of a source model, maintained incrementally.
+
+    Set ``source`` to the ``'app_label.ModelName'`` of the source model,
+    ``group_by`` to the names of its non-null fields to group rows by, and
+    ``measures`` to a dict mapping column names to :class:`Count`,
+    :class:`Sum`, :class:`Min` or :class:`Max`. Declare model fields for the
+    group keys and measures as on any other view.
+    """
+    source = None
+    group_by = ()
+    measures = {}
+    sql = _AggregateQuery()
+
+    @classmethod
+    def refresh(cls, concurrently=False, using=None):
+        """Recompute the whole summary table from the source.
+
+        This is only needed to repair the summary, e.g. after the triggers
+        were disabled. Readers see the old summary until it commits.
+        Returns the number of rows in the summary.
+        """
+        if using is None:
+            using = router.db_for_write(cls)
+        sql = AggregateSQL(cls)
+        with trace('pgviews.refresh', view=sql.table, concurrently=False,
+                   using=using) as span:
+            with transaction.atomic(using=using), \
+                    connections[using].cursor() as cursor:
+                # Hold off writers, whose triggers would update the summary
+                # while it is being recomputed.
+                started = time.monotonic()
+                cursor.execute(
+                    'LOCK TABLE {0} IN SHARE MODE;'.format(sql.source))
+                span.set_attribute('lock_wait', time.monotonic() - started)
+                cursor.execute('DELETE FROM {0};'.format(sql.table))
+                cursor.execute('INSERT INTO {0} {1};'.format(
+                    sql.table, sql.select(sql.source)))
+                rows = cursor.rowcount
+            span.set_attribute('rows', rows)
+        view_refreshed.send(
+            sender=cls, concurrently=False, duration=span.duration, rows=rows,
+            using=using, attempts=1)
+        return rows
+
+    class Meta(BaseManagerMeta):
+        abstract = True
+        managed = False
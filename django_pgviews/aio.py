@@ -0,0 +1,255 @@
+"""Refresh and read views from asyncio code.
+
+Refreshes run on connections of their own from psycopg 3's
+``AsyncConnection``, so awaiting them ties up neither the event loop nor a
+thread. Without psycopg 3 installed, the usual synchronous refresh runs in a
+thread instead.
+"""
+import asyncio
+import itertools
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import EmptyResultSet
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.db.models.query import ModelIterable
+
+from django_pgviews.databases import run_in_thread
+from django_pgviews.db.timeouts import retry_delay
+from django_pgviews.graph import ViewGraph, get_view_models
+from django_pgviews.introspection import EXTENSION_QUERY
+from django_pgviews.locks import get_lock_mode, view_lock
+from django_pgviews.refresh import REFRESHED_VIEWS
+from django_pgviews.signals import view_refreshed
+from django_pgviews.tracing import trace
+from django_pgviews.view import MaterializedView
+
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+
+log = logging.getLogger('django_pgviews.view')
+
+# Connection parameters only psycopg2 understands
+PSYCOPG2_PARAMS = ('cursor_factory', 'isolation_level', 'server_side_binding')
+
+
+async def connect(using=DEFAULT_DB_ALIAS):
+    """Open a new psycopg 3 ``AsyncConnection`` to the ``using`` database.
+
+    The connection is in autocommit mode, and closing it is up to the caller.
+    """
+    params = dict(connections[using].get_connection_params())
+    params['dbname'] = params.pop('database')
+    for name in PSYCOPG2_PARAMS:
+        params.pop(name, None)
+    return await psycopg.AsyncConnection.connect(autocommit=True, **params)
+
+
+async def _advisory_lock(conn, key, mode):
+    """Take the advisory lock ``key`` for the session of ``conn``.
+
+    Returns False if the work it guards should be skipped, see
+    :func:`django_pgviews.locks.advisory_lock`.
+    """
+    if not mode:
+        return True
+    if mode == 'skip':
+        cursor = await conn.execute(
+            'SELECT pg_try_advisory_lock(%s, %s);', key)
+        return (await cursor.fetchone())[0]
+    await conn.execute('SELECT pg_advisory_lock(%s, %s);', key)
+    return True
+
+
+async def _execute_with_timeouts(conn, sql, lock_timeout, statement_timeout,
+        count=None):
+    """Run ``sql`` in a transaction with timeouts in seconds on ``conn``.
+
+    Returns the row count of the statement if Postgres reports it, or the
+    number of rows in table ``count`` once it has run, if given.
+    """
+    async with conn.transaction():
+        for name, timeout in (('lock_timeout', lock_timeout),
+                              ('statement_timeout', statement_timeout)):
+            if timeout is not None:
+                await conn.execute(
+                    'SELECT set_config(%s, %s, true);',
+                    [name, '%dms' % max(1, timeout * 1000)])
+        cursor = await conn.execute(sql)
+        if count is not None:
+            cursor = await conn.execute(
+                'SELECT count(*) FROM {0};'.format(count))
+            return (await cursor.fetchone())[0]
+        return cursor.rowcount if cursor.rowcount >= 0 else None
+
+
+async def _maintain(view_cls, conn, using, lock_timeout, statement_timeout):
+    """Run the maintenance of ``view_cls`` after a refresh on ``conn``.
+    """
+    maintenance = view_cls._maintenance
+    prewarm = False
+    if maintenance.prewarm:
+        cursor = await conn.execute(EXTENSION_QUERY, ['pg_prewarm'])
+        prewarm = (await cursor.fetchone())[0]
+    table = view_cls._meta.db_table
+    for action, sql in maintenance.statements(
+            connections[using], table, prewarm):
+        with trace('pgviews.maintain', view=table, action=action,
+                   statement=sql):
+            await _execute_with_timeouts(
+                conn, sql, lock_timeout, statement_timeout)
+
+
+async def arefresh(view_cls, concurrently=False, using=None,
+        lock_timeout=None, statement_timeout=None, retries=0, backoff=0.5,
+        strict=False, lock=None):
+    """Refresh ``view_cls`` without blocking the event loop.
+
+    Takes the same options as
+    :meth:`~django_pgviews.view.MaterializedView.refresh`, and also sends
+    ``view_refreshed``, from a thread. Snapshot views are always refreshed
+    in a thread. Other views raise :exc:`TypeError`.
+    """
+    if not issubclass(view_cls, REFRESHED_VIEWS):
+        raise TypeError(
+            '{0} is not a materialized or snapshot view'.format(
+                view_cls.__name__))
+    if using is None:
+        using = router.db_for_write(view_cls)
+    if psycopg is None or not issubclass(view_cls, MaterializedView):
+        return await sync_to_async(run_in_thread, thread_sensitive=False)(
+            using, view_cls.refresh, concurrently=concurrently, using=using,
+            lock_timeout=lock_timeout, statement_timeout=statement_timeout,
+            retries=retries, backoff=backoff, strict=strict, lock=lock)
+
+    concurrently, sql = view_cls._refresh_statement(concurrently, strict)
+    lock = get_lock_mode('PGVIEWS_REFRESH_LOCK', lock)
+    conn = await connect(using)
+    try:
+        # The lock goes with the connection once the refresh is over.
+        if not await _advisory_lock(conn, view_lock(view_cls), lock):
+            log.info('pgview %s is being refreshed by another process, '
+                     'skipping', view_cls.__name__)
+            return None
+        with trace('pgviews.refresh', view=view_cls._meta.db_table,
+                   concurrently=concurrently, statement=sql,
+                   using=using) as span:
+            attempts = 0
+            while True:
+                attempts += 1
+                try:
+                    rows = await _execute_with_timeouts(
+                        conn, sql, lock_timeout, statement_timeout,
+                        count=view_cls._meta.db_table)
+                    break
+                except psycopg.errors.LockNotAvailable:
+                    if attempts > retries:
+                        raise
+                    await asyncio.sleep(
+                        retry_delay(view_cls, backoff, attempts))
+            span.set_attribute('rows', rows)
+            span.set_attribute('attempts', attempts)
+            await _maintain(view_cls, conn, using, lock_timeout,
+                            statement_timeout)
+    finally:
+        await conn.close()
+    # Receivers may use the database through Django.
+    await sync_to_async(view_refreshed.send)(
+        sender=view_cls, concurrently=concurrently, duration=span.duration,
+        rows=rows, using=using, attempts=attempts)
+    return rows
+
+
+async def arefresh_views(graph=None, views=None, concurrently=False,
+        workers=4, using=DEFAULT_DB_ALIAS, **options):
+    """Refresh every materialized view in ``graph``, dependencies first.
+
+    Like :func:`~django_pgviews.refresh.refresh_views`, but up to
+    ``workers`` views of a level are refreshed at the same time by
+    :func:`arefresh`, rather than in threads.
+
+    Returns the list of refreshed views, in the order they finished.
+    """
+    if graph is None:
+        graph = ViewGraph(get_view_models(using))
+    semaphore = asyncio.Semaphore(workers)
+    refreshed = []
+
+    async def refresh(view_cls):
+        async with semaphore:
+            await arefresh(view_cls, concurrently=concurrently, using=using,
+                           **options)
+        refreshed.append(view_cls)
+
+    with trace('pgviews.refresh_views', concurrently=concurrently,
+               workers=workers, using=using):
+        for level in graph.levels:
+            level = [
+                view_cls for view_cls in level
+                if issubclass(view_cls, REFRESHED_VIEWS) and
+                (views is None or view_cls in views)]
+            # Wait for the whole level before moving on to its dependents.
+            await asyncio.gather(*[refresh(view_cls) for view_cls in level])
+    return refreshed
+
+
+def _reads_directly(queryset):
+    """Whether the rows of ``queryset`` can be turned into model instances
+    as they come from the database.
+    """
+    query = queryset.query
+    return (
+        psycopg is not None and
+        queryset._iterable_class is ModelIterable and
+        not query.select_related and not query.annotations and
+        not query.deferred_loading[0] and
+        not any(hasattr(field, 'from_db_value')
+                for field in queryset.model._meta.concrete_fields))
+
+
+async def aiterate(queryset, chunk_size=2000):
+    """Iterate over ``queryset`` without blocking the event loop.
+
+    Rows are fetched ``chunk_size`` at a time. Model instances are read on a
+    psycopg 3 connection of their own, with a server-side cursor. Other
+    querysets, e.g. from ``values()`` or ``select_related()``, and every
+    queryset without psycopg 3 installed, are read from Django's connection
+    in a thread.
+    """
+    if not _reads_directly(queryset):
+        iterator = queryset.iterator(chunk_size)
+        # The same thread each time, as the rows come from a server-side
+        # cursor on its connection.
+        fetch = sync_to_async(
+            lambda: list(itertools.islice(iterator, chunk_size)),
+            thread_sensitive=True)
+        while True:
+            chunk = await fetch()
+            if not chunk:
+                return
+            for obj in chunk:
+                yield obj
+
+    model = queryset.model
+    names = [field.attname for field in model._meta.concrete_fields]
+    try:
+        sql, params = queryset.values_list(*names).query.get_compiler(
+            using=queryset.db).as_sql()
+    except EmptyResultSet:
+        return
+    conn = await connect(queryset.db)
+    try:
+        async with conn.transaction():
+            cursor = conn.cursor(name='pgviews_aiterate')
+            await cursor.execute(sql, params)
+            while True:
+                rows = await cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield model.from_db(queryset.db, names, row)
+    finally:
+        await conn.close()
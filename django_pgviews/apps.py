@@ -1,8 +1,12 @@
 import logging
 
 from django import apps
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
 from django.db.models import signals
 
+from .databases import is_postgres
+
 log = logging.getLogger('django_pgviews.sync_pgviews')
 
 
@@ -10,25 +14,40 @@ class ViewConfig(apps.AppConfig):
     """The base configuration for Django PGViews. We use this to setup our
     post_migrate signal handlers.
     """
-    counter = 0
     name = 'django_pgviews'
     verbose_name = 'Django Postgres Views'
 
-    def sync_pgviews(self, sender, app_config, **kwargs):
-        """Forcibly sync the views.
+    def sync_pgviews(self, sender, app_config, using=DEFAULT_DB_ALIAS,
+            **kwargs):
+        """Forcibly sync the views on the database just migrated, if it is
+        a Postgres database.
         """
-        self.counter = self.counter + 1
+        if not is_postgres(using):
+            return
+        self.counters[using] = self.counters.get(using, 0) + 1
         total = len([a for a in apps.apps.get_app_configs() if a.models_module is not None])
         
-        if self.counter == total:
+        if self.counters[using] == total:
             log.info('All applications have migrated, time to sync')
             # Import here otherwise Django doesn't start properly
             # (models in app init are not allowed)
             from .models import ViewSyncer
             vs = ViewSyncer()
-            vs.run(force=True, update=True) 
+            vs.run(force=True, update=True, using=using)
+
+    def install_wrappers(self, sender, connection, **kwargs):
+        """Make reads of views without data fail with a clear error.
+        """
+        from .view import translate_not_populated
+        if connection.vendor == 'postgresql' and \
+                translate_not_populated not in connection.execute_wrappers:
+            # First, so wrappers others add and remove stay in order.
+            connection.execute_wrappers.insert(0, translate_not_populated)
 
     def ready(self):
         """Find and setup the apps to set the post_migrate hooks for.
         """
+        # Apps migrated so far, per database alias.
+        self.counters = {}
         signals.post_migrate.connect(self.sync_pgviews)
+        connection_created.connect(self.install_wrappers)
@@ -0,0 +1,145 @@
+"""Cache the results of querysets on materialized views.
+
+The rows of a materialized view only change when it is refreshed or
+synced. Results are cached under a generation number of their view, which
+is bumped whenever that happens, so cached results are never stale and
+never need to expire: old generations are simply not read any more.
+
+Results are stored in the cache named by the ``PGVIEWS_CACHE`` setting,
+``'default'`` unless set. Generations are bumped by whichever process
+refreshes the view, so the cache must be shared by all processes: the
+local-memory and dummy backends are rejected.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import EmptyResultSet, ImproperlyConfigured
+from django.db import transaction
+from django.db.models.query import (
+    FlatValuesListIterable, ModelIterable, ValuesIterable, ValuesListIterable)
+from django.dispatch import receiver
+
+from django_pgviews.graph import get_view_models
+from django_pgviews.signals import all_views_synced, view_refreshed
+from django_pgviews.view import ReadOnlyViewManager, ReadOnlyViewQuerySet
+
+
+# Results of other iterables, e.g. named tuples, can't be pickled.
+CACHED_ITERABLES = (
+    ModelIterable, ValuesIterable, ValuesListIterable, FlatValuesListIterable)
+
+_MISSING = object()
+
+
+def get_cache():
+    """Return the cache named by ``PGVIEWS_CACHE``, shared between processes.
+    """
+    alias = getattr(settings, 'PGVIEWS_CACHE', 'default')
+    cache = caches[alias]
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            "PGVIEWS_CACHE must name a cache shared between processes, "
+            "got {0!r} using {1}".format(alias, type(cache).__name__))
+    return cache
+
+
+def _generation_key(view_cls, using):
+    return 'pgviews:generation:{0}:{1}'.format(using, view_cls._meta.db_table)
+
+
+def get_generation(view_cls, using):
+    """Return the current generation of ``view_cls`` on the ``using`` database.
+    """
+    cache = get_cache()
+    key = _generation_key(view_cls, using)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from a random generation, so results cached before the
+        # generation was evicted are not read again.
+        cache.add(key, uuid.uuid4().int >> 65, None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(view_cls, using):
+    """Stop reading the results cached so far for ``view_cls``.
+    """
+    try:
+        get_cache().incr(_generation_key(view_cls, using))
+    except ValueError:
+        # Not set, so the next read starts a new generation anyway.
+        pass
+
+
+@receiver(view_refreshed)
+def _view_refreshed(sender, using, **kwargs):
+    # Bump now for reads later in the same transaction, and again once the
+    # refresh is visible to everyone, in case others cached the old rows in
+    # between.
+    bump_generation(sender, using)
+    transaction.on_commit(lambda: bump_generation(sender, using), using=using)
+
+
+@receiver(all_views_synced)
+def _views_synced(sender, using, **kwargs):
+    for view_cls in get_view_models(using):
+        bump_generation(view_cls, using)
+
+
+class CachedViewQuerySet(ReadOnlyViewQuerySet):
+    """A read-only queryset caching its rows, counts and aggregates.
+    """
+    def _cache_key(self, kind, *args):
+        """Return the key caching a ``kind`` of result of the query, or None.
+        """
+        try:
+            sql, params = self.query.get_compiler(using=self.db).as_sql()
+        except EmptyResultSet:
+            return None
+        digest = hashlib.sha1(
+            repr((kind, sql, params) + args).encode('utf-8')).hexdigest()
+        return 'pgviews:{0}:{1}:{2}:{3}'.format(
+            self.db, self.model._meta.db_table,
+            get_generation(self.model, self.db), digest)
+
+    def _cached(self, key, compute):
+        if key is None:
+            return compute()
+        cache = get_cache()
+        result = cache.get(key, _MISSING)
+        if result is _MISSING:
+            result = compute()
+            cache.set(key, result)
+        return result
+
+    def _fetch_all(self):
+        if (self._result_cache is None and
+                self._iterable_class in CACHED_ITERABLES):
+            self._result_cache = self._cached(
+                self._cache_key(
+                    'rows', self._iterable_class.__name__, self._fields),
+                lambda: list(self._iterable_class(self)))
+        super(CachedViewQuerySet, self)._fetch_all()
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        return self._cached(
+            self._cache_key('count'), super(CachedViewQuerySet, self).count)
+
+    def aggregate(self, *args, **kwargs):
+        return self._cached(
+            self._cache_key('aggregate', args, sorted(kwargs.items())),
+            lambda: super(CachedViewQuerySet, self).aggregate(
+                *args, **kwargs))
+
+
+class CachedViewManager(ReadOnlyViewManager):
+    """Manager of a materialized view caching the results of its querysets.
+    """
+    def get_queryset(self):
+        return CachedViewQuerySet(self.model, using=self._db)
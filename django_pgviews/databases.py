@@ -0,0 +1,70 @@
+"""Manage views on several databases at once, e.g. one per shard.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import collections
+
+from django.core.management.base import CommandError
+from django.db import connections
+
+
+def is_postgres(using):
+    """Return whether database ``using`` is a Postgres database.
+    """
+    return connections[using].vendor == 'postgresql'
+
+
+def postgres_databases():
+    """Return the aliases of every configured Postgres database.
+    """
+    return [alias for alias in connections if is_postgres(alias)]
+
+
+def run_in_thread(alias, func, *args, **kwargs):
+    """Call ``func`` from a worker thread, then close the thread's connection
+    to database ``alias``.
+    """
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connections[alias].close()
+
+
+def run_on_databases(func, databases):
+    """Call ``func(using)`` for each of ``databases`` at the same time.
+
+    Each database is handled by its own thread, on its own connection.
+    Returns an ordered dict mapping each database to what ``func`` returned,
+    or to the exception it raised.
+    """
+    results = collections.OrderedDict()
+    if not databases:
+        return results
+    with ThreadPoolExecutor(max_workers=len(databases)) as executor:
+        futures = [
+            (using, executor.submit(run_in_thread, using, func, using))
+            for using in databases]
+        for using, future in futures:
+            try:
+                results[using] = future.result()
+            except Exception as exc:
+                results[using] = exc
+    return results
+
+
+def report_databases(log, results, action):
+    """Log the outcome on each database of :func:`run_on_databases`.
+
+    Raises a :class:`~django.core.management.base.CommandError` naming the
+    databases that failed, if any.
+    """
+    failed = []
+    for using, result in results.items():
+        if isinstance(result, Exception):
+            log.error('pgviews not %s on database %s: %s', action, using,
+                      result, exc_info=result)
+            failed.append(using)
+        else:
+            log.info('pgviews %s on database %s', action, using)
+    if failed:
+        raise CommandError('pgviews not {0} on database(s): {1}'.format(
+            action, ', '.join(failed)))
@@ -0,0 +1,59 @@
+from psycopg2.extensions import encodings
+
+
+class StatementBatch(object):
+    """Send DDL statements to the database on a cursor.
+
+    When ``deferred`` is True, statements are collected and sent together in
+    a single round trip by :meth:`flush`, which must be called before
+    anything is read back from the database. Otherwise each statement is run
+    straight away.
+    """
+    def __init__(self, cursor, deferred=False):
+        self.cursor = cursor
+        self.deferred = deferred
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        if not self.deferred:
+            self.cursor.execute(sql, params)
+            return
+        if params is not None:
+            sql = self.cursor.mogrify(sql, params)
+            if isinstance(sql, bytes):
+                sql = sql.decode(
+                    encodings[self.cursor.connection.encoding])
+        self.statements.append(sql.strip().rstrip(';'))
+
+    def execute_now(self, sql, params=None):
+        """Run ``sql`` straight away, after the collected statements, so that
+        its errors can be caught.
+        """
+        self.flush()
+        self.cursor.execute(sql, params)
+
+    def flush(self):
+        """Send the collected statements to the database.
+        """
+        if self.statements:
+            # Separators go on their own line in case a statement ends with
+            # a -- comment.
+            sql = '\n;\n'.join(self.statements) + '\n;'
+            self.statements = []
+            self.cursor.execute(sql)
+
+
+class RecordingBatch(StatementBatch):
+    """Record DDL statements in ``statements`` rather than running them.
+
+    Reads still go to the database on ``cursor``, and see it as it was
+    before any of the recorded statements.
+    """
+    def __init__(self, cursor):
+        super(RecordingBatch, self).__init__(cursor, deferred=True)
+
+    def execute_now(self, sql, params=None):
+        self.execute(sql, params)
+
+    def flush(self):
+        pass
@@ -0,0 +1,59 @@
+"""Run statements with timeouts, and retry those that could not get their
+locks in time.
+"""
+import logging
+import random
+
+from django.db import transaction
+from psycopg2 import errorcodes
+
+
+log = logging.getLogger('django_pgviews.view')
+
+
+def execute_with_timeouts(connection, sql, lock_timeout=None,
+        statement_timeout=None, params=None, fetch=False):
+    """Run ``sql`` in a transaction, or a savepoint, with timeouts in seconds.
+
+    Returns the row count of the statement if Postgres reports it, or its
+    first row if ``fetch`` is True.
+    """
+    timeouts = [
+        (name, '%dms' % max(1, timeout * 1000))
+        for name, timeout in (('lock_timeout', lock_timeout),
+                              ('statement_timeout', statement_timeout))
+        if timeout is not None]
+    with transaction.atomic(using=connection.alias), \
+            connection.cursor() as cursor:
+        previous = []
+        for name, value in timeouts:
+            cursor.execute(
+                'SELECT current_setting(%s), set_config(%s, %s, true);',
+                [name, name, value])
+            previous.append((name, cursor.fetchone()[0]))
+        cursor.execute(sql, params)
+        if fetch:
+            rows = cursor.fetchone()
+        else:
+            rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        # Don't leave the timeouts set in a transaction this one is part of.
+        for name, value in previous:
+            cursor.execute('SELECT set_config(%s, %s, true);', [name, value])
+    return rows
+
+
+def lock_not_available(exc):
+    """Return whether ``exc`` was raised for a lock that was not granted in
+    time.
+    """
+    return getattr(exc.__cause__, 'pgcode', None) == \
+        errorcodes.LOCK_NOT_AVAILABLE
+
+
+def retry_delay(view_cls, backoff, attempts):
+    """Return how long to wait after ``attempts`` failed to get a lock.
+    """
+    delay = random.uniform(0, backoff * 2 ** (attempts - 1))
+    log.warning('pgview %s is locked, retrying in %.3fs',
+                view_cls.__name__, delay)
+    return delay
@@ -0,0 +1,229 @@
+"""Dependency graph of the views defined in installed applications.
+"""
+import collections
+
+from django.apps import apps
+from django.db import router
+
+from django_pgviews.view import View
+
+
+class DependencyError(Exception):
+    """The declared view dependencies can't be resolved.
+    """
+
+
+class MissingDependencyError(DependencyError):
+    """Views depend on views that are not installed.
+
+    ``missing`` maps each view name to the dependencies that were not found.
+    """
+    def __init__(self, missing):
+        self.missing = missing
+        super(MissingDependencyError, self).__init__(
+            'pgviews have unknown dependencies: %s' % '; '.join(
+                '%s -> %s' % (name, ', '.join(deps))
+                for name, deps in missing.items()))
+
+
+class CyclicDependencyError(DependencyError):
+    """Views depend on each other in a cycle.
+
+    ``cycles`` is a list of cycles, each a list of view names where every view
+    depends on the next and the last depends on the first.
+    """
+    def __init__(self, cycles):
+        self.cycles = cycles
+        super(CyclicDependencyError, self).__init__(
+            'pgviews have cyclic dependencies: %s' % '; '.join(
+                ' -> '.join(cycle + [cycle[0]]) for cycle in cycles))
+
+
+class UnknownViewError(LookupError):
+    """Views were selected by names that are not installed.
+
+    ``labels`` is the list of app labels and view names that matched no view.
+    """
+    def __init__(self, labels):
+        self.labels = labels
+        super(UnknownViewError, self).__init__(
+            'no pgviews match: %s' % ', '.join(labels))
+
+
+def view_name(view_cls):
+    """Return the name views use to refer to ``view_cls`` in ``dependencies``.
+    """
+    return '{}.{}'.format(view_cls._meta.app_label, view_cls.__name__)
+
+
+def get_view_models(using=None):
+    """Return the list of installed views that have SQL to sync.
+
+    If ``using`` is given, only the views the database routers allow on that
+    database are returned.
+    """
+    return [
+        view_cls for view_cls in apps.get_models()
+        if isinstance(view_cls, type) and
+        issubclass(view_cls, View) and
+        hasattr(view_cls, 'sql') and
+        (using is None or router.allow_migrate_model(using, view_cls))]
+
+
+def select_views(labels, upstream=False, downstream=False):
+    """Return the installed views named by ``labels``, in dependency order.
+
+    See :meth:`ViewGraph.select`. Returns None, meaning every view, if no
+    labels are given.
+    """
+    if not labels:
+        return None
+    return ViewGraph().select(labels, upstream=upstream, downstream=downstream)
+
+
+class ViewGraph(object):
+    """The views and their dependencies, sorted topologically.
+
+    ``levels`` is a list of lists of views: every view only depends on views
+    in earlier levels, so the views in a single level are independent of
+    each other. ``order`` is the same views flattened into one list.
+
+    Raises :class:`MissingDependencyError` or :class:`CyclicDependencyError`
+    if the dependencies can't be resolved.
+    """
+    def __init__(self, views=None):
+        if views is None:
+            views = get_view_models()
+        self.views = collections.OrderedDict(
+            (view_name(view_cls), view_cls) for view_cls in views)
+        self.dependencies = collections.OrderedDict(
+            (name, tuple(view_cls._dependencies))
+            for name, view_cls in self.views.items())
+        self.dependents = collections.OrderedDict(
+            (name, []) for name in self.views)
+
+        missing = collections.OrderedDict()
+        for name, deps in self.dependencies.items():
+            unknown = [dep for dep in deps if dep not in self.views]
+            if unknown:
+                missing[name] = unknown
+            for dep in set(deps):
+                if dep in self.dependents:
+                    self.dependents[dep].append(name)
+        if missing:
+            raise MissingDependencyError(missing)
+
+        self.levels = [
+            [self.views[name] for name in level] for level in self._sort()]
+        self.order = [view_cls for level in self.levels for view_cls in level]
+        self.depth = dict(
+            (view_name(view_cls), i)
+            for i, level in enumerate(self.levels) for view_cls in level)
+
+    def _sort(self):
+        """Sort the view names into levels using Kahn's algorithm.
+        """
+        pending = dict(
+            (name, len(set(deps))) for name, deps in self.dependencies.items())
+        level = [name for name, count in pending.items() if count == 0]
+        levels = []
+        while level:
+            levels.append(level)
+            next_level = []
+            for name in level:
+                del pending[name]
+                for dependent in self.dependents[name]:
+                    pending[dependent] -= 1
+                    if pending[dependent] == 0:
+                        next_level.append(dependent)
+            # Keep the order the views were defined in within a level.
+            level = [name for name in self.views if name in next_level]
+
+        if pending:
+            raise CyclicDependencyError(self._find_cycles(pending))
+        return levels
+
+    def _find_cycles(self, remaining):
+        """Return the cycles among the views that could not be sorted.
+
+        Every remaining view depends on at least one other remaining view, so
+        following those dependencies always ends in a cycle.
+        """
+        cycles = []
+        visited = set()
+        for start in self.views:
+            if start not in remaining or start in visited:
+                continue
+            path = []
+            name = start
+            while name not in visited:
+                visited.add(name)
+                path.append(name)
+                name = next(
+                    dep for dep in self.dependencies[name] if dep in remaining)
+            if name in path:
+                cycles.append(path[path.index(name):])
+        return cycles
+
+    def _closure(self, views, edges):
+        """Return ``views`` and every view reachable through ``edges``, in
+        order.
+        """
+        names = set(view_name(view_cls) for view_cls in views)
+        pending = list(names)
+        while pending:
+            for name in edges[pending.pop()]:
+                if name not in names:
+                    names.add(name)
+                    pending.append(name)
+        return [
+            view_cls for view_cls in self.order
+            if view_name(view_cls) in names]
+
+    def downstream(self, views):
+        """Return ``views`` and every view depending on them, in order.
+        """
+        return self._closure(views, self.dependents)
+
+    def upstream(self, views):
+        """Return ``views`` and every view they depend on, in order.
+        """
+        return self._closure(views, self.dependencies)
+
+    def select(self, labels, upstream=False, downstream=False):
+        """Return the views named by ``labels``, in order.
+
+        Each label is either an app label, selecting every view of the app,
+        or ``app_label.ViewName``, compared case-insensitively like model
+        labels. If ``upstream`` is True, the views they depend on are
+        selected too, and if ``downstream`` is True, the views depending on
+        them.
+
+        Raises :class:`UnknownViewError` if a label matches no view.
+        """
+        selected = []
+        unknown = []
+        for label in labels:
+            matches = [
+                view_cls for view_cls in self.order
+                if label.lower() in (
+                    view_cls._meta.app_label.lower(),
+                    view_name(view_cls).lower())]
+            if not matches:
+                unknown.append(label)
+            selected.extend(matches)
+        if unknown:
+            raise UnknownViewError(unknown)
+
+        views = set(selected)
+        if upstream:
+            views.update(self.upstream(selected))
+        if downstream:
+            views.update(self.downstream(selected))
+        return [view_cls for view_cls in self.order if view_cls in views]
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
@@ -0,0 +1,246 @@
+"""Read the current state of views from the Postgres catalog.
+"""
+import collections
+import json
+
+
+ViewState = collections.namedtuple(
+    'ViewState',
+    ['name', 'kind', 'columns', 'definition', 'comment', 'populated',
+     'options', 'tablespace'])
+ViewState.__doc__ = """The state of a view in the database.
+
+``kind`` is ``'v'`` for a view, ``'m'`` for a materialized view and ``'r'``
+for the table of an aggregate view, as in ``pg_class.relkind``. ``columns`` is a list of :class:`Column`, in order.
+``definition`` is the query as rewritten by Postgres and ``comment`` holds
+the fingerprint of the last sync. ``populated`` is False for a materialized
+view created ``WITH NO DATA`` and not refreshed since. ``options`` lists its
+storage parameters as ``name=value`` strings, and ``tablespace`` is the name
+of the tablespace it is stored in.
+"""
+
+Column = collections.namedtuple('Column', ['name', 'type_oid', 'type_mod'])
+
+
+def split_view_name(view_name):
+    """Return the schema and relation names of ``view_name``.
+
+        >>> split_view_name('myapp_view')
+        ('public', 'myapp_view')
+        >>> split_view_name('myschema.myapp_view')
+        ('myschema', 'myapp_view')
+    """
+    if '.' in view_name:
+        vschema, vname = view_name.split('.', 1)
+    else:
+        vschema, vname = 'public', view_name
+    return vschema, vname
+
+
+def get_view_states(cursor, view_names):
+    """Return the state of the named views, using a single query.
+
+    Returns a dict mapping each name in ``view_names`` that exists as a view,
+    materialized view or table to its :class:`ViewState`.
+    """
+    names = dict((split_view_name(name), name) for name in view_names)
+    if not names:
+        return {}
+    schemas, relnames = zip(*names.keys())
+    cursor.execute(
+        """SELECT n.nspname, c.relname, c.relkind,
+            CASE WHEN c.relkind IN ('v', 'm') THEN pg_get_viewdef(c.oid) END,
+            obj_description(c.oid, 'pg_class'), c.relispopulated,
+            c.reloptions, COALESCE(ts.spcname, (
+                SELECT dt.spcname FROM pg_database d
+                JOIN pg_tablespace dt ON dt.oid = d.dattablespace
+                WHERE d.datname = current_database())),
+            array_agg(a.attname::text ORDER BY a.attnum),
+            array_agg(a.atttypid::bigint ORDER BY a.attnum),
+            array_agg(a.atttypmod ORDER BY a.attnum)
+        FROM unnest(%s::text[], %s::text[]) AS t(nspname, relname)
+        JOIN pg_namespace n ON n.nspname = t.nspname
+        JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = t.relname
+        LEFT JOIN pg_attribute a ON a.attrelid = c.oid
+            AND a.attnum > 0 AND NOT a.attisdropped
+        LEFT JOIN pg_tablespace ts ON ts.oid = c.reltablespace
+        WHERE c.relkind IN ('v', 'm', 'r')
+        GROUP BY n.nspname, c.relname, c.relkind, c.oid, c.relispopulated,
+            c.reloptions, ts.spcname;""",
+        [list(schemas), list(relnames)])
+
+    states = {}
+    for (vschema, vname, kind, definition, comment, populated, options,
+            tablespace, col_names, col_types, col_mods) in cursor.fetchall():
+        name = names[(vschema, vname)]
+        states[name] = ViewState(
+            name=name, kind=kind, definition=definition, comment=comment,
+            populated=populated, options=options or [],
+            tablespace=tablespace,
+            columns=[
+                Column(*col) for col in zip(col_names, col_types, col_mods)
+                if col[0] is not None])
+    return states
+
+
+def describe_query(cursor, query):
+    """Return the columns ``query`` would produce, without running it.
+
+    The type modifier of the columns is not known and is None.
+    """
+    cursor.execute('SELECT * FROM ({0}) AS pgviews_describe LIMIT 0;'.format(
+        query.strip().rstrip(';')))
+    return [Column(col[0], col[1], None) for col in cursor.description]
+
+
+def estimate_query(cursor, query):
+    """Return the rows and total cost the planner estimates for ``query``,
+    without running it.
+    """
+    cursor.execute('EXPLAIN (FORMAT JSON) {0};'.format(
+        query.strip().rstrip(';')))
+    plan = cursor.fetchone()[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows'], plan[0]['Plan']['Total Cost']
+
+
+EXTENSION_QUERY = (
+    'SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = %s);')
+
+
+def has_extension(cursor, name):
+    """Return whether the extension ``name`` is installed in the database.
+    """
+    cursor.execute(EXTENSION_QUERY, [name])
+    return cursor.fetchone()[0]
+
+
+def columns_compatible(old_columns, new_columns):
+    """Whether a view with ``old_columns`` can be replaced in place.
+
+    ``CREATE OR REPLACE VIEW`` requires the new query to produce the same
+    columns, with the same names and types in the same order, but allows
+    new columns to be added at the end.
+    """
+    if len(new_columns) < len(old_columns):
+        return False
+    return all(
+        old.name == new.name and old.type_oid == new.type_oid
+        for old, new in zip(old_columns, new_columns))
+
+
+DependentView = collections.namedtuple(
+    'DependentView', ['name', 'kind', 'definition', 'comment', 'indexes',
+                      'key', 'references', 'populated', 'storage'])
+DependentView.__doc__ = """A view that depends on another view.
+
+``name`` is quoted and schema-qualified, and ``indexes`` holds the
+``CREATE INDEX`` statements of a materialized view, each followed by
+moving the index to its tablespace, if any. ``storage`` is the ``WITH`` and
+``TABLESPACE`` clauses of a materialized view. ``key`` is the
+``(schema, name)`` of the view, as returned by :func:`split_view_name`, and
+``references`` the keys of the relations it reads from directly.
+``populated`` is as for :class:`ViewState`.
+"""
+
+
+def get_dependent_views(cursor, view_name):
+    """Return every view that depends on ``view_name``, directly or not.
+
+    The views are ordered so that each comes after the views it depends on,
+    and can be recreated in that order.
+    """
+    cursor.execute(
+        """WITH RECURSIVE deps(oid, depth) AS (
+            SELECT r.ev_class, 1
+            FROM pg_depend d
+            JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE d.classid = 'pg_rewrite'::regclass
+            AND d.refclassid = 'pg_class'::regclass
+            AND d.refobjid = %s::regclass
+            AND r.ev_class <> d.refobjid
+        UNION
+            SELECT r.ev_class, deps.depth + 1
+            FROM deps
+            JOIN pg_depend d ON d.refobjid = deps.oid
+            JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE d.classid = 'pg_rewrite'::regclass
+            AND d.refclassid = 'pg_class'::regclass
+            AND r.ev_class <> d.refobjid
+        )
+        SELECT quote_ident(n.nspname) || '.' || quote_ident(c.relname),
+            c.relkind, pg_get_viewdef(c.oid),
+            obj_description(c.oid, 'pg_class'),
+            ARRAY(SELECT s.sql FROM (
+                      SELECT i.indexrelid, 0 AS step,
+                          pg_get_indexdef(i.indexrelid) AS sql
+                      FROM pg_index i WHERE i.indrelid = c.oid
+                  UNION ALL
+                      SELECT i.indexrelid, 1, 'ALTER INDEX ' ||
+                          i.indexrelid::regclass::text ||
+                          ' SET TABLESPACE ' || quote_ident(it.spcname)
+                      FROM pg_index i
+                      JOIN pg_class ic ON ic.oid = i.indexrelid
+                      JOIN pg_tablespace it ON it.oid = ic.reltablespace
+                      WHERE i.indrelid = c.oid) s
+                  ORDER BY s.indexrelid, s.step),
+            n.nspname, c.relname,
+            ARRAY(SELECT DISTINCT ARRAY[rn.nspname::text, rc.relname::text]
+                  FROM pg_rewrite rw
+                  JOIN pg_depend rd ON rd.objid = rw.oid
+                  JOIN pg_class rc ON rc.oid = rd.refobjid
+                  JOIN pg_namespace rn ON rn.oid = rc.relnamespace
+                  WHERE rd.classid = 'pg_rewrite'::regclass
+                  AND rd.refclassid = 'pg_class'::regclass
+                  AND rw.ev_class = c.oid AND rc.oid <> c.oid),
+            c.relispopulated,
+            COALESCE(' WITH (' || array_to_string(c.reloptions, ', ') || ')',
+                     '') ||
+            COALESCE(' TABLESPACE ' || quote_ident(t.spcname), '')
+        FROM (SELECT oid, max(depth) AS depth FROM deps GROUP BY oid) x
+        JOIN pg_class c ON c.oid = x.oid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_tablespace t ON t.oid = c.reltablespace
+        ORDER BY x.depth, c.oid;""",
+        [view_name])
+    return [
+        DependentView(
+            name, kind, definition, comment, indexes, (vschema, vname),
+            [tuple(ref) for ref in references], populated, storage)
+        for (name, kind, definition, comment, indexes, vschema, vname,
+             references, populated, storage) in cursor.fetchall()]
+
+
+def get_source_tables(cursor, view_name):
+    """Return the tables ``view_name`` reads from, directly or through views.
+
+    Returns a list of ``(oid, name)`` pairs, where ``name`` is quoted and
+    schema-qualified. Materialized views read by the view are not followed.
+    """
+    cursor.execute(
+        """WITH RECURSIVE refs(oid) AS (
+            SELECT d.refobjid
+            FROM pg_rewrite r
+            JOIN pg_depend d ON d.objid = r.oid
+            WHERE d.classid = 'pg_rewrite'::regclass
+            AND d.refclassid = 'pg_class'::regclass
+            AND r.ev_class = %s::regclass
+            AND d.refobjid <> r.ev_class
+        UNION
+            SELECT d.refobjid
+            FROM refs
+            JOIN pg_class c ON c.oid = refs.oid AND c.relkind = 'v'
+            JOIN pg_rewrite r ON r.ev_class = c.oid
+            JOIN pg_depend d ON d.objid = r.oid
+            WHERE d.classid = 'pg_rewrite'::regclass
+            AND d.refclassid = 'pg_class'::regclass
+            AND d.refobjid <> r.ev_class
+        )
+        SELECT c.oid::bigint, c.oid::regclass::text
+        FROM refs
+        JOIN pg_class c ON c.oid = refs.oid
+        WHERE c.relkind IN ('r', 'p')
+        ORDER BY c.oid;""",
+        [view_name])
+    return cursor.fetchall()
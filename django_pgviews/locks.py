@@ -0,0 +1,87 @@
+"""Postgres advisory locks coordinating syncs and refreshes across nodes.
+
+When several processes sync or refresh views on the same database at the
+same time, e.g. every node of a deployment running ``migrate``, they take
+turns through advisory locks: one for syncing, and one per view for
+refreshing. How a process that finds a lock taken behaves is set by the
+``PGVIEWS_SYNC_LOCK`` and ``PGVIEWS_REFRESH_LOCK`` settings:
+
+* ``'wait'`` - Wait for the lock. Views synced in the meantime are then
+  unchanged and skipped, so they are still only rebuilt once.
+* ``'skip'`` - Don't wait, and leave the work to whoever holds the lock.
+* ``False`` - Don't take the lock at all.
+
+Syncs wait by default, and refreshes don't take locks unless configured to.
+"""
+from contextlib import contextmanager
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+LOCK_MODES = ('wait', 'skip', False)
+
+DEFAULT_MODES = {
+    'PGVIEWS_SYNC_LOCK': 'wait',
+    'PGVIEWS_REFRESH_LOCK': False,
+}
+
+
+def _int4(name):
+    """Hash ``name`` to a signed 32 bit integer, as advisory lock keys are.
+    """
+    value = zlib.crc32(name.encode('utf-8')) & 0xffffffff
+    return value - (1 << 32) if value >= (1 << 31) else value
+
+
+# The first half of every lock key, telling pgviews locks from others.
+NAMESPACE = _int4('django_pgviews')
+
+SYNC_LOCK = (NAMESPACE, 0)
+
+
+def view_lock(view_cls):
+    """Return the key of the lock held while refreshing ``view_cls``.
+    """
+    return (NAMESPACE, _int4(view_cls._meta.db_table))
+
+
+def get_lock_mode(setting, mode=None):
+    """Return ``mode``, or the lock mode from ``setting`` if it is None.
+    """
+    if mode is None:
+        mode = getattr(settings, setting, DEFAULT_MODES[setting])
+    if mode is None:
+        mode = False
+    if mode not in LOCK_MODES:
+        raise ImproperlyConfigured(
+            "{0} must be 'wait', 'skip' or False, got {1!r}".format(
+                setting, mode))
+    return mode
+
+
+@contextmanager
+def advisory_lock(connection, key, mode='wait'):
+    """Hold the session-level advisory lock ``key`` on ``connection``.
+
+    Yields False if the work it guards should be skipped, because another
+    session holds the lock and ``mode`` is ``'skip'``. With ``False``, the
+    lock is not taken and True is yielded.
+    """
+    if not mode:
+        yield True
+        return
+    with connection.cursor() as cursor:
+        if mode == 'skip':
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s);', key)
+            acquired = cursor.fetchone()[0]
+        else:
+            cursor.execute('SELECT pg_advisory_lock(%s, %s);', key)
+            acquired = True
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s, %s);', key)
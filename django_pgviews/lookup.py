@@ -0,0 +1,179 @@
+"""In-memory copies of small materialized views, for lookups by key.
+
+A :class:`LookupTable` loads its whole view into memory once, and serves
+lookups by key without going to the database. ``refresh()`` and
+``sync_pgviews`` send a ``NOTIFY`` once they commit. Each process listens for
+these on a connection of its own, and drops the copy of a view that was
+refreshed before its next lookup, so the view is loaded again.
+"""
+import os
+import threading
+
+import psycopg2
+from django.db import connections, router
+from django.dispatch import receiver
+
+from django_pgviews.graph import get_view_models
+from django_pgviews.signals import all_views_synced, view_refreshed
+
+
+NOTIFY_CHANNEL = 'pgviews_refreshed'
+
+# Database -> (process ID, listening connection)
+_listeners = {}
+# Every LookupTable, to drop when their view is refreshed
+_tables = []
+_lock = threading.RLock()
+
+
+def _notify(using, views):
+    """Tell every process the views with a lookup table among ``views``
+    changed.
+    """
+    views = set(views) & set(table.model for table in _tables)
+    if not views:
+        return
+    with connections[using].cursor() as cursor:
+        for view_cls in views:
+            cursor.execute('SELECT pg_notify(%s, %s);',
+                           [NOTIFY_CHANNEL, view_cls._meta.db_table])
+
+
+@receiver(view_refreshed)
+def _view_refreshed(sender, using, **kwargs):
+    # Notifications are only delivered once the refresh has committed.
+    _notify(using, [sender])
+
+
+@receiver(all_views_synced)
+def _views_synced(sender, using, **kwargs):
+    _notify(using, get_view_models(using))
+
+
+def _listen(using):
+    """Start listening on ``using`` from this process.
+    """
+    connection = connections[using]
+    listener = connection.get_new_connection(
+        connection.get_connection_params())
+    listener.autocommit = True
+    listener.cursor().execute('LISTEN {0};'.format(NOTIFY_CHANNEL))
+    _listeners[using] = (os.getpid(), listener)
+    # Refreshes may have been missed before listening, e.g. in a forked
+    # process or after losing the connection.
+    for table in _tables:
+        table.tables.pop(using, None)
+
+
+def _poll(using):
+    """Drop the tables of the views refreshed on ``using`` since last time.
+    """
+    pid, listener = _listeners.get(using, (None, None))
+    if pid != os.getpid():
+        _listen(using)
+        return
+    try:
+        listener.poll()
+    except psycopg2.Error:
+        listener.close()
+        _listen(using)
+        return
+    while listener.notifies:
+        payload = listener.notifies.pop(0).payload
+        for table in _tables:
+            if table.model._meta.db_table == payload:
+                table.tables.pop(using, None)
+
+
+def close_listeners():
+    """Stop listening for refreshes from this process.
+
+    Every lookup table is loaded again on its next lookup.
+    """
+    with _lock:
+        for using, (pid, listener) in list(_listeners.items()):
+            if pid == os.getpid():
+                listener.close()
+            del _listeners[using]
+        for table in _tables:
+            table.tables.clear()
+
+
+class LookupTable(object):
+    """An in-memory copy of a materialized view, indexed by ``key``.
+
+    ``key`` is the name of a field whose values are unique in the view. The
+    copy holds a tuple of values per row, and lookups return model
+    instances built from them. Declare it on the view::
+
+        class Country(pg.ReadOnlyMaterializedView):
+            lookup = LookupTable('code')
+
+        Country.lookup.get('FR')
+    """
+    def __init__(self, key='pk'):
+        self.key = key
+        # Database -> (field names, key -> row)
+        self.tables = {}
+
+    def contribute_to_class(self, model, name):
+        self.model = model
+        setattr(model, name, self)
+        _tables.append(self)
+
+    def _load(self, using):
+        meta = self.model._meta
+        names = [field.attname for field in meta.concrete_fields]
+        position = names.index(self.key_field.attname)
+        rows = {}
+        for values in self.model._base_manager.using(using).values_list(
+                *names):
+            rows[values[position]] = values
+        return names, rows
+
+    @property
+    def key_field(self):
+        if self.key == 'pk':
+            return self.model._meta.pk
+        return self.model._meta.get_field(self.key)
+
+    def table(self, using=None):
+        """Return the database used, and the field names and rows of the
+        view on it, loading them if needed.
+        """
+        if using is None:
+            using = router.db_for_read(self.model)
+        with _lock:
+            _poll(using)
+            if using not in self.tables:
+                self.tables[using] = self._load(using)
+            return using, self.tables[using]
+
+    def get(self, key, using=None):
+        """Return the row with ``key``.
+
+        Raises the view's ``DoesNotExist`` if there is none.
+        """
+        using, (names, rows) = self.table(using)
+        try:
+            values = rows[self.key_field.to_python(key)]
+        except KeyError:
+            raise self.model.DoesNotExist(
+                '%s matching %s=%r does not exist.' % (
+                    self.model._meta.object_name, self.key, key))
+        return self.model.from_db(using, names, values)
+
+    def filter(self, keys, using=None):
+        """Return the rows with any of ``keys``, in the order of ``keys``.
+        """
+        using, (names, rows) = self.table(using)
+        to_python = self.key_field.to_python
+        return [
+            self.model.from_db(using, names, rows[key])
+            for key in (to_python(key) for key in keys) if key in rows]
+
+    def __contains__(self, key):
+        return self.key_field.to_python(key) in self.table()[1][1]
+
+    def __len__(self):
+        return len(self.table()[1][1])
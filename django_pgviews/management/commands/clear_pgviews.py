@@ -1,10 +1,16 @@
 import logging
 
-from django.core.management.base import BaseCommand
-from django.apps import apps
-from django.db import connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
 
-from django_pgviews.view import clear_view, View, MaterializedView
+from django_pgviews.aggregate import AggregateView, clear_aggregate_view
+from django_pgviews.databases import (
+    postgres_databases, report_databases, run_on_databases)
+from django_pgviews.graph import (
+    UnknownViewError, get_view_models, select_views, view_name)
+from django_pgviews.refresher import remove_triggers
+from django_pgviews.snapshot import SnapshotView, clear_snapshot_view
+from django_pgviews.view import clear_view, MaterializedView
 
 
 log = logging.getLogger('django_pgviews.sync_pgviews')
@@ -13,18 +19,65 @@ log = logging.getLogger('django_pgviews.sync_pgviews')
 class Command(BaseCommand):
     help = """Clear Postgres views. Use this before running a migration"""
 
-    def handle(self, **options):
+    def add_arguments(self, parser):
+        parser.add_argument('targets',
+            nargs='*',
+            metavar='app_label[.ViewName]',
+            help="""Only clear the views of these apps, or these views.""")
+        parser.add_argument('--upstream',
+            action='store_true',
+            dest='upstream',
+            default=False,
+            help="""Also clear the views the selected views depend on.""")
+        parser.add_argument('--downstream',
+            action='store_true',
+            dest='downstream',
+            default=False,
+            help="""Also clear the views depending on the selected views.""")
+        parser.add_argument('--database',
+            dest='database',
+            default=DEFAULT_DB_ALIAS,
+            help="""Nominates a database to clear views on. Defaults to the
+            "default" database.""")
+        parser.add_argument('--all-databases',
+            action='store_true',
+            dest='all_databases',
+            default=False,
+            help="""Clear views on every Postgres database at the same time,
+            e.g. on every shard.""")
+
+    def handle(self, targets, upstream, downstream, database, all_databases,
+            **options):
         """
         """
-        for view_cls in apps.get_models():
-            if not (isinstance(view_cls, type) and
-                    issubclass(view_cls, View) and
-                    hasattr(view_cls, 'sql')):
+        try:
+            self.views = select_views(targets, upstream, downstream)
+        except UnknownViewError as exc:
+            raise CommandError(str(exc))
+
+        if all_databases:
+            report_databases(
+                log, run_on_databases(self.clear, postgres_databases()),
+                'cleared')
+        else:
+            self.clear(database)
+
+    def clear(self, using):
+        """Clear the views on the ``using`` database.
+        """
+        connection = connections[using]
+        for view_cls in get_view_models(using):
+            if self.views is not None and view_cls not in self.views:
                 continue
-            python_name = '{}.{}'.format(view_cls._meta.app_label, view_cls.__name__)
-            status = clear_view(
-                connection, view_cls._meta.db_table,
-                materialized=isinstance(view_cls(), MaterializedView))
+            python_name = view_name(view_cls)
+            if issubclass(view_cls, AggregateView):
+                status = clear_aggregate_view(connection, view_cls)
+            elif issubclass(view_cls, SnapshotView):
+                status = clear_snapshot_view(connection, view_cls)
+            else:
+                status = clear_view(
+                    connection, view_cls._meta.db_table,
+                    materialized=isinstance(view_cls(), MaterializedView))
             if status == 'DROPPED':
                 msg = 'dropped'
             else:
@@ -33,3 +86,7 @@ class Command(BaseCommand):
                 'python_name': python_name,
                 'view_name': view_cls._meta.db_table,
                 'msg': msg})
+        if self.views is None:
+            # Nothing is left for pgviews_refresher to watch.
+            with connection.cursor() as cursor:
+                remove_triggers(cursor)
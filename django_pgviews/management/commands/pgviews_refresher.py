@@ -0,0 +1,74 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from django_pgviews.refresher import Refresher
+
+
+log = logging.getLogger('django_pgviews.pgviews_refresher')
+
+
+class Command(BaseCommand):
+    help = """Refresh materialized views whenever their source tables
+    change. Runs until interrupted."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debounce',
+            type=float,
+            dest='debounce',
+            default=1.0,
+            help="""Seconds without changes to wait for before refreshing
+            a view.""")
+        parser.add_argument('--concurrently',
+            action='store_true',
+            dest='concurrently',
+            default=False,
+            help="""Refresh concurrently, without blocking reads, where the
+            view has a concurrent_index.""")
+        parser.add_argument('-j', '--workers',
+            type=int,
+            dest='workers',
+            default=1,
+            help="""Number of views to refresh in parallel, each on its own
+            database connection.""")
+        parser.add_argument('--lock-timeout',
+            type=float,
+            dest='lock_timeout',
+            default=None,
+            help="""Seconds to wait for the lock on a view before giving
+            up on refreshing it.""")
+        parser.add_argument('--statement-timeout',
+            type=float,
+            dest='statement_timeout',
+            default=None,
+            help="""Seconds a refresh may run before it is cancelled.""")
+        parser.add_argument('--retries',
+            type=int,
+            dest='retries',
+            default=0,
+            help="""Times to retry a refresh that timed out waiting for its
+            lock, with a randomized, growing delay in between.""")
+        parser.add_argument('--strict',
+            action='store_true',
+            dest='strict',
+            default=False,
+            help="""Fail rather than refresh a view exclusively, locking
+            readers out.""")
+        parser.add_argument('--database',
+            dest='database',
+            default=DEFAULT_DB_ALIAS,
+            help="""Nominates a database to refresh views on. Defaults to
+            the "default" database.""")
+
+    def handle(self, debounce, concurrently, workers, lock_timeout,
+            statement_timeout, retries, strict, database, **options):
+        refresher = Refresher(
+            debounce=debounce, concurrently=concurrently, workers=workers,
+            using=database, lock_timeout=lock_timeout,
+            statement_timeout=statement_timeout, retries=retries,
+            strict=strict)
+        try:
+            refresher.run()
+        except KeyboardInterrupt:
+            log.info('pgviews_refresher stopped')
@@ -0,0 +1,107 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from django_pgviews.databases import (
+    postgres_databases, report_databases, run_on_databases)
+from django_pgviews.graph import UnknownViewError, select_views
+from django_pgviews.refresh import refresh_views
+
+
+log = logging.getLogger('django_pgviews.refresh_pgviews')
+
+
+class Command(BaseCommand):
+    help = """Refresh materialized views, dependencies first."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets',
+            nargs='*',
+            metavar='app_label[.ViewName]',
+            help="""Only refresh the views of these apps, or these views.""")
+        parser.add_argument('--upstream',
+            action='store_true',
+            dest='upstream',
+            default=False,
+            help="""Also refresh the views the selected views depend on.""")
+        parser.add_argument('--downstream',
+            action='store_true',
+            dest='downstream',
+            default=False,
+            help="""Also refresh the views depending on the selected views.""")
+        parser.add_argument('--concurrently',
+            action='store_true',
+            dest='concurrently',
+            default=False,
+            help="""Refresh concurrently, without blocking reads, where the
+            view has a concurrent_index.""")
+        parser.add_argument('--unpopulated',
+            action='store_true',
+            dest='unpopulated',
+            default=False,
+            help="""Only fill the views synced without data and not refreshed
+            since.""")
+        parser.add_argument('-j', '--workers',
+            type=int,
+            dest='workers',
+            default=1,
+            help="""Number of views to refresh in parallel, each on its own
+            database connection.""")
+        parser.add_argument('--lock-timeout',
+            type=float,
+            dest='lock_timeout',
+            default=None,
+            help="""Seconds to wait for the lock on a view before giving
+            up on refreshing it.""")
+        parser.add_argument('--statement-timeout',
+            type=float,
+            dest='statement_timeout',
+            default=None,
+            help="""Seconds a refresh may run before it is cancelled.""")
+        parser.add_argument('--retries',
+            type=int,
+            dest='retries',
+            default=0,
+            help="""Times to retry a refresh that timed out waiting for its
+            lock, with a randomized, growing delay in between.""")
+        parser.add_argument('--strict',
+            action='store_true',
+            dest='strict',
+            default=False,
+            help="""Fail rather than refresh a view exclusively, locking
+            readers out.""")
+        parser.add_argument('--database',
+            dest='database',
+            default=DEFAULT_DB_ALIAS,
+            help="""Nominates a database to refresh views on. Defaults to the
+            "default" database.""")
+        parser.add_argument('--all-databases',
+            action='store_true',
+            dest='all_databases',
+            default=False,
+            help="""Refresh views on every Postgres database at the same time,
+            e.g. on every shard.""")
+
+    def handle(self, targets, upstream, downstream, concurrently,
+            unpopulated, workers, lock_timeout, statement_timeout, retries,
+            strict, database, all_databases, **options):
+        try:
+            views = select_views(targets, upstream, downstream)
+        except UnknownViewError as exc:
+            raise CommandError(str(exc))
+
+        def refresh(using):
+            refresh_views(
+                views=views, concurrently=concurrently, workers=workers,
+                using=using, unpopulated=unpopulated,
+                lock_timeout=lock_timeout,
+                statement_timeout=statement_timeout, retries=retries,
+                strict=strict)
+
+        if all_databases:
+            report_databases(
+                log, run_on_databases(refresh, postgres_databases()),
+                'refreshed')
+        else:
+            refresh(database)
@@ -1,20 +1,47 @@
 from optparse import make_option
 import logging
 
-from django.core.management.base import BaseCommand
-from django.db import connection
-from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
 
-from django_pgviews.models import ViewSyncer
+from django_pgviews.databases import (
+    postgres_databases, report_databases, run_on_databases)
+from django_pgviews.graph import UnknownViewError, select_views, view_name
+from django_pgviews.models import TABLE_VIEWS, ViewSyncer
 
 
 log = logging.getLogger('django_pgviews.sync_pgviews')
 
+# Status of a view in a dry run -> what syncing would do to it
+PLAN_ACTIONS = {
+    'CREATED': 'create',
+    'UPDATED': 'drop and rebuild',
+    'FORCED': 'drop and rebuild',
+    'ALTERED': 'alter storage',
+    'EXISTS': 'exists, skip',
+    'UNCHANGED': 'unchanged',
+    'FORCE_REQUIRED': 'incompatible schema, needs --force',
+}
+
 
 class Command(BaseCommand):
     help = """Create/update Postgres views for all installed apps."""
     
     def add_arguments(self, parser):
+        parser.add_argument('targets',
+            nargs='*',
+            metavar='app_label[.ViewName]',
+            help="""Only sync the views of these apps, or these views.""")
+        parser.add_argument('--upstream',
+            action='store_true',
+            dest='upstream',
+            default=False,
+            help="""Also sync the views the selected views depend on.""")
+        parser.add_argument('--downstream',
+            action='store_true',
+            dest='downstream',
+            default=False,
+            help="""Also sync the views depending on the selected views.""")
         parser.add_argument('--no-update',
             action='store_false',
             dest='update',
@@ -26,7 +53,81 @@ class Command(BaseCommand):
             default=False,
             help="""Force replacement of pre-existing views where
             breaking changes have been made to the schema.""")
+        parser.add_argument('--atomic',
+            action='store_true',
+            dest='atomic',
+            default=False,
+            help="""Sync all views in a single transaction, sending
+            statements in batches. If any view fails, no view is changed.""")
+        parser.add_argument('--swap',
+            action='store_true',
+            dest='swap',
+            default=False,
+            help="""Rebuild changed materialized views under a shadow name
+            and swap them in, so they stay readable during the rebuild.""")
+        parser.add_argument('--no-data',
+            action='store_const',
+            const=False,
+            dest='with_data',
+            default=None,
+            help="""Create materialized views without data, to be filled later
+            by refresh_pgviews --unpopulated.""")
+        parser.add_argument('--plan',
+            action='store_true',
+            dest='plan',
+            default=False,
+            help="""Print what would be done to each view and the DDL that
+            would be run, with the estimated cost of building materialized
+            views, without changing anything.""")
+        parser.add_argument('--database',
+            dest='database',
+            default=DEFAULT_DB_ALIAS,
+            help="""Nominates a database to sync views on. Defaults to the
+            "default" database.""")
+        parser.add_argument('--all-databases',
+            action='store_true',
+            dest='all_databases',
+            default=False,
+            help="""Sync views on every Postgres database at the same time,
+            e.g. on every shard.""")
+
+    def handle(self, targets, upstream, downstream, force, update, atomic,
+            swap, with_data, plan, database, all_databases, **options):
+        try:
+            views = select_views(targets, upstream, downstream)
+        except UnknownViewError as exc:
+            raise CommandError(str(exc))
+
+        if plan:
+            databases = all_databases and postgres_databases() or [database]
+            for using in databases:
+                if all_databases:
+                    self.stdout.write('Database %s:' % using)
+                self.print_plan(ViewSyncer().dry_run(
+                    force, update, swap=swap, using=using, views=views,
+                    with_data=with_data))
+            return
+
+        def sync(using):
+            vs = ViewSyncer()
+            vs.run(force, update, atomic=atomic, swap=swap, using=using,
+                   views=views, with_data=with_data)
+
+        if all_databases:
+            report_databases(
+                log, run_on_databases(sync, postgres_databases()), 'synced')
+        else:
+            sync(database)
 
-    def handle(self, force, update, **options):
-        vs = ViewSyncer()
-        vs.run(force, update)
+    def print_plan(self, planned):
+        for view_cls, status, statements, estimate in planned:
+            if status == 'UPDATED' and not issubclass(view_cls, TABLE_VIEWS):
+                action = 'create or replace'
+            else:
+                action = PLAN_ACTIONS[status]
+            if estimate is not None:
+                action += ' (estimated %d rows, cost %.2f)' % estimate
+            self.stdout.write('%s: %s' % (view_name(view_cls), action))
+            for statement in statements:
+                self.stdout.write('    %s;' % statement.replace(
+                    '\n', '\n    '))
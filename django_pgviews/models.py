@@ -1,81 +1,288 @@
+import collections
 import logging
 
-from django.apps import apps
-from django.db import connection
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS, ProgrammingError, connections, transaction)
 
-from django_pgviews.view import create_view, View, MaterializedView
+from django_pgviews.aggregate import AggregateView, create_aggregate_view
+from django_pgviews.db.batch import RecordingBatch, StatementBatch
+from django_pgviews.graph import ViewGraph, get_view_models, view_name
+from django_pgviews.introspection import (
+    estimate_query, get_view_states, split_view_name)
+from django_pgviews.locks import SYNC_LOCK, advisory_lock, get_lock_mode
+from django_pgviews.snapshot import SnapshotView, create_snapshot_view
+from django_pgviews.view import (
+    create_view, get_fingerprint, MaterializedView, RebuildPlan, ViewIndex)
 from django_pgviews.signals import view_synced, all_views_synced
+from django_pgviews.tracing import trace
 
 log = logging.getLogger('django_pgviews.sync_pgviews')
 
+# Views whose data is stored, and rebuilt rather than replaced
+TABLE_VIEWS = (MaterializedView, AggregateView, SnapshotView)
+
+PlannedView = collections.namedtuple(
+    'PlannedView', ['view_cls', 'status', 'statements', 'estimate'])
+PlannedView.__doc__ = """What syncing a view would do, see
+:meth:`ViewSyncer.dry_run`.
+"""
+
 
 class ViewSyncer(object):
-    def run(self, force, update, **options):
+    def run(self, force, update, atomic=False, swap=False,
+            using=DEFAULT_DB_ALIAS, views=None, lock=None, with_data=None,
+            **options):
+        """Sync every installed view, dependencies first.
+
+        If ``views`` is given, only those views are synced, still in
+        dependency order.
+
+        Views are synced on the ``using`` database, if the database routers
+        allow them there.
+
+        Raises a :class:`~django_pgviews.graph.DependencyError` before
+        touching the database if the dependencies can't be resolved.
+
+        If ``atomic`` is True, all views are synced in one transaction on one
+        cursor, and statements are sent in batches rather than one at a time.
+        Either every view is synced or, if anything fails, none are, and
+        ``view_synced`` is only sent once the transaction has committed.
+
+        If ``with_data`` is False, materialized views being built are created
+        ``WITH NO DATA``, as are views with ``with_data = False``, and are
+        filled by a later ``refresh_views(unpopulated=True)``. It defaults to
+        the ``PGVIEWS_WITH_DATA`` setting, or True.
+
+        If ``swap`` is True, changed materialized views are built under a
+        shadow name and swapped in, so they stay readable while rebuilding.
+
+        Views depending on a view that has to be dropped, whether synced by
+        pgviews or not, are dropped and recreated as part of the sync rather
+        than lost to a ``DROP ... CASCADE``.
+
+        Only one sync runs on a database at a time, see
+        :mod:`django_pgviews.locks`. ``lock`` overrides the
+        ``PGVIEWS_SYNC_LOCK`` setting. Returns False if the sync was skipped
+        because another one was running.
+        """
+        order = self.prepare(swap, using, views, with_data)
+        lock = get_lock_mode('PGVIEWS_SYNC_LOCK', lock)
+        with advisory_lock(self.connection, SYNC_LOCK, lock) as acquired, \
+                trace('pgviews.sync_views', atomic=atomic, swap=swap,
+                      using=using):
+            if not acquired:
+                log.info('pgviews are being synced by another process, '
+                         'skipping')
+                return False
+            if atomic:
+                with transaction.atomic(using=using), \
+                        self.connection.cursor() as cursor:
+                    self.batch = StatementBatch(cursor, deferred=True)
+                    results = list(
+                        self.sync_views(order, force, update))
+                    self.batch.flush()
+            else:
+                self.batch = None
+                results = self.sync_views(order, force, update)
+            for view_cls, status in results:
+                self.report(view_cls, status, force, update)
+        for dependent in self.plan.pending.values():
+            log.warning(
+                "pgview dependency %s was dropped and could not be recreated",
+                dependent.name)
+        all_views_synced.send(sender=None, using=using)
+        return True
+
+    def prepare(self, swap, using, views, with_data=None):
+        """Set up a sync on ``using``, and return the views to sync in order.
+        """
+        if with_data is None:
+            with_data = getattr(settings, 'PGVIEWS_WITH_DATA', True)
         self.synced = []
-        backlog = []
-        for view_cls in apps.get_models():
-            if not (isinstance(view_cls, type) and
-                    issubclass(view_cls, View) and
-                    hasattr(view_cls, 'sql')):
-                continue
-            backlog.append(view_cls)
-        loop = 0
-        while len(backlog) > 0 and loop < 10:
-            loop += 1
-            backlog = self.run_backlog(backlog, force, update)
-
-        if loop >= 10:
-            log.warn('pgviews dependencies hit limit. Check if your model dependencies are correct')
+        self.swap = swap
+        self.with_data = with_data
+        self.durations = {}
+        self.using = using
+        self.connection = connections[using]
+        self.graph = graph = ViewGraph(get_view_models(using))
+        order = [
+            view_cls for view_cls in graph.order
+            if views is None or view_cls in views]
+        self.plan = RebuildPlan(expected=dict(
+            (split_view_name(view_cls._meta.db_table), get_fingerprint(
+                self.connection, view_cls._meta.db_table, view_cls.sql,
+                **self.get_options(view_cls)))
+            for view_cls in order
+            if not issubclass(view_cls, (AggregateView, SnapshotView))))
+        return order
+
+    def dry_run(self, force, update, swap=False, using=DEFAULT_DB_ALIAS,
+            views=None, with_data=None):
+        """Return what :meth:`run` would do, without changing anything.
+
+        Returns a list of :class:`PlannedView`, one per view in order.
+        ``statements`` holds the DDL that would be run for the view,
+        including recreating views depending on it. For materialized,
+        aggregate and snapshot views that would be built, ``estimate`` is the
+        ``(rows, cost)`` the planner expects for their query, or None if it
+        can't tell, e.g. because the query reads from a view not created yet.
+
+        A ``CREATE OR REPLACE VIEW`` that turns out to need ``force`` when
+        run, e.g. because the length of a varchar changed, is still planned
+        as ``UPDATED``, as is one whose columns can't be checked because its
+        query reads from a view not created yet.
+        """
+        order = self.prepare(swap, using, views, with_data)
+        planned = []
+        with transaction.atomic(using=using), \
+                self.connection.cursor() as cursor:
+            self.batch = RecordingBatch(cursor)
+            for view_cls, status in self.sync_views(order, force, update):
+                estimate = None
+                if status in ('CREATED', 'UPDATED', 'FORCED') and issubclass(
+                        view_cls, TABLE_VIEWS):
+                    estimate = self.estimate(cursor, view_cls)
+                planned.append(PlannedView(
+                    view_cls, status, self.batch.statements, estimate))
+                self.batch.statements = []
+        return planned
+
+    def estimate(self, cursor, view_cls):
+        try:
+            with transaction.atomic(using=self.using):
+                return estimate_query(cursor, view_cls.sql)
+        except ProgrammingError:
+            return None
+
+    def sync_views(self, views, force, update):
+        """Sync ``views`` in order, yielding each view and its status.
+        """
+        self.load_snapshot(views)
+        for i, view_cls in enumerate(views):
+            status = self.sync_view(view_cls, force, update)
+            yield view_cls, status
+            if status == 'FORCED' or (
+                    status == 'UPDATED' and
+                    issubclass(view_cls, TABLE_VIEWS)):
+                # The view was dropped, and the views depending on it with
+                # it.
+                self.load_snapshot(views[i + 1:])
+
+    def load_snapshot(self, views):
+        """Load the current state of ``views`` from the database in one go.
+        """
+        names = [view_cls._meta.db_table for view_cls in views]
+        # Views dropped for a rebuild and not recreated yet are gone, even
+        # when a dry run only recorded dropping them.
+        names = [
+            name for name in names
+            if split_view_name(name) not in self.plan.missing]
+        if self.batch is not None:
+            self.batch.flush()
+            states = get_view_states(self.batch.cursor, names)
         else:
-            all_views_synced.send(sender=None)
-
-    def run_backlog(self, models, force, update):
-        '''Installs the list of models given from the previous backlog
-
-        If the correct dependent views have not been installed, the view
-        will be added to the backlog.
-
-        Eventually we get to a point where all dependencies are sorted.
-        '''
-        backlog = []
-        for view_cls in models:
-            skip = False
-            name = '{}.{}'.format(view_cls._meta.app_label, view_cls.__name__)
-            for dep in view_cls._dependencies:
-                if dep not in self.synced:
-                    skip = True
-            if skip is True:
-                backlog.append(view_cls)
-                log.info('Putting pgview at back of queue: %s', name)
-                continue # Skip
-
-            try:
-                status = create_view(connection, view_cls._meta.db_table,
-                        view_cls.sql, update=update, force=force,
-                        materialized=isinstance(view_cls(), MaterializedView),
-                        index=view_cls._concurrent_index)
-                view_synced.send(
-                    sender=view_cls, update=update, force=force, status=status,
-                    has_changed=status not in ('EXISTS', 'FORCE_REQUIRED'))
-                self.synced.append(name)
-            except Exception as exc:
-                exc.view_cls = view_cls
-                exc.python_name = name
-                raise
-            else:
-                if status == 'CREATED':
-                    msg = "created"
-                elif status == 'UPDATED':
-                    msg = "updated"
-                elif status == 'EXISTS':
-                    msg = "already exists, skipping"
-                elif status == 'FORCED':
-                    msg = "forced overwrite of existing schema"
-                elif status == 'FORCE_REQUIRED':
-                    msg = (
-                        "exists with incompatible schema, "
-                        "--force required to update")
-                log.info("pgview %(python_name)s %(msg)s" % {
-                    'python_name': name,
-                    'msg': msg})
-        return backlog
+            with self.connection.cursor() as cursor:
+                states = get_view_states(cursor, names)
+        self.snapshot = dict(
+            (name, states[name]) for name in names if name in states)
+        for name, state in self.snapshot.items():
+            if state.kind == 'm':
+                self.plan.set_populated(split_view_name(name), state.populated)
+
+    def sync_view(self, view_cls, force, update):
+        """Installs a single view whose dependencies have been synced.
+        """
+        name = view_name(view_cls)
+        # From now on, the view is recreated as it is if it gets dropped.
+        self.plan.expected.pop(split_view_name(view_cls._meta.db_table), None)
+        try:
+            with trace('pgviews.sync', view=view_cls._meta.db_table) as span:
+                if issubclass(view_cls, AggregateView):
+                    status = create_aggregate_view(self.connection, view_cls,
+                            update=update, snapshot=self.snapshot,
+                            batch=self.batch, plan=self.plan)
+                elif issubclass(view_cls, SnapshotView):
+                    status = create_snapshot_view(self.connection, view_cls,
+                            update=update, snapshot=self.snapshot,
+                            batch=self.batch, plan=self.plan,
+                            with_data=self.get_with_data(view_cls))
+                else:
+                    status = create_view(
+                            self.connection, view_cls._meta.db_table,
+                            view_cls.sql, update=update, force=force,
+                            snapshot=self.snapshot, batch=self.batch,
+                            swap=self.swap, plan=self.plan,
+                            with_data=self.get_with_data(view_cls),
+                            maintenance=view_cls._maintenance,
+                            storage=view_cls._storage_parameters,
+                            tablespace=view_cls._meta.db_tablespace,
+                            **self.get_options(view_cls))
+                span.set_attribute('status', status)
+            self.synced.append(name)
+            self.durations[view_cls] = span.duration
+        except Exception as exc:
+            exc.view_cls = view_cls
+            exc.python_name = name
+            raise
+        return status
+
+    def get_options(self, view_cls):
+        """Return the arguments describing a view to :func:`create_view`.
+        """
+        materialized = issubclass(view_cls, MaterializedView)
+        return dict(
+            materialized=materialized,
+            index=view_cls._concurrent_index,
+            index_storage=materialized and
+            view_cls._index_storage_parameters or None,
+            # Where Django puts the indexes of a model
+            index_tablespace=materialized and (
+                settings.DEFAULT_INDEX_TABLESPACE or
+                view_cls._meta.db_tablespace) or None,
+            columns=[f.column for f in view_cls._meta.concrete_fields],
+            indexes=materialized and [
+                ViewIndex(view_cls, index)
+                for index in view_cls._meta.indexes] or [])
+
+    def get_with_data(self, view_cls):
+        """Whether ``view_cls`` can be built with data, see
+        :func:`create_view`.
+        """
+        if self.plan.unpopulated.intersection(
+                split_view_name(dep._meta.db_table)
+                for dep in self.graph.upstream([view_cls])
+                if dep is not view_cls):
+            return False
+        return not issubclass(view_cls, MaterializedView) or (
+            self.with_data and view_cls._with_data)
+
+    def report(self, view_cls, status, force, update):
+        """Send ``view_synced`` and log the outcome of syncing a view.
+        """
+        duration = self.durations[view_cls]
+        view_synced.send(
+            sender=view_cls, update=update, force=force, status=status,
+            has_changed=status not in (
+                'EXISTS', 'UNCHANGED', 'FORCE_REQUIRED'),
+            duration=duration, using=self.using)
+        if status == 'CREATED':
+            msg = "created"
+        elif status == 'UPDATED':
+            msg = "updated"
+        elif status == 'ALTERED':
+            msg = "storage altered"
+        elif status == 'EXISTS':
+            msg = "already exists, skipping"
+        elif status == 'UNCHANGED':
+            msg = "unchanged, skipping"
+        elif status == 'FORCED':
+            msg = "forced overwrite of existing schema"
+        elif status == 'FORCE_REQUIRED':
+            msg = (
+                "exists with incompatible schema, "
+                "--force required to update")
+        log.info("pgview %(python_name)s %(msg)s (%(duration).3fs)" % {
+            'python_name': view_name(view_cls),
+            'msg': msg,
+            'duration': duration})
@@ -0,0 +1,124 @@
+"""Refresh materialized views in dependency order.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from django_pgviews.databases import run_in_thread
+from django_pgviews.graph import ViewGraph, get_view_models, view_name
+from django_pgviews.introspection import get_view_states
+from django_pgviews.snapshot import SnapshotView
+from django_pgviews.tracing import trace
+from django_pgviews.view import MaterializedView
+
+
+# Views refreshed by refresh_views
+REFRESHED_VIEWS = (MaterializedView, SnapshotView)
+
+
+log = logging.getLogger('django_pgviews.refresh_pgviews')
+
+
+def _refresh(view_cls, concurrently, using, options):
+    """Refresh a view and log how long it took, and how.
+    """
+    started = time.monotonic()
+    view_cls.refresh(concurrently=concurrently, using=using, **options)
+    log.info('pgview %s refreshed %s (%.3fs)',
+             view_name(view_cls),
+             (issubclass(view_cls, SnapshotView) or
+              concurrently and view_cls._concurrent_index is not None) and
+             'concurrently' or 'exclusively',
+             time.monotonic() - started)
+    return view_cls
+
+
+def _empty_snapshots(cursor, graph, levels, states):
+    """Return the tables of the snapshot views in ``levels`` that may have
+    been created without data.
+
+    Postgres counts every table as populated. Snapshot views are only
+    created without data when they read from views without any, and are
+    then empty.
+    """
+    for level in levels:
+        for view_cls in level:
+            table = view_cls._meta.db_table
+            if (issubclass(view_cls, SnapshotView) and table in states and
+                    graph.dependencies[view_name(view_cls)]):
+                cursor.execute(
+                    'SELECT NOT EXISTS (SELECT 1 FROM {0});'.format(table))
+                if cursor.fetchone()[0]:
+                    yield table
+
+
+def refresh_views(graph=None, views=None, concurrently=False, workers=1,
+        using=DEFAULT_DB_ALIAS, unpopulated=False, **options):
+    """Refresh every materialized and snapshot view in ``graph``,
+    dependencies first.
+
+    Views are refreshed on the ``using`` database. ``graph`` defaults to a
+    :class:`~django_pgviews.graph.ViewGraph` of the installed views the
+    database routers allow there. Its levels are refreshed one after another, and the
+    views within a level don't depend on each other, so up to ``workers`` of
+    them are refreshed at the same time. Each worker thread uses its own
+    database connection. With a single worker, views are refreshed one at a
+    time on the current connection.
+
+    If ``views`` is given, only those views are refreshed, still level by
+    level. Other ``options``, e.g. ``lock_timeout`` or ``strict``, are
+    passed on to :meth:`~django_pgviews.view.MaterializedView.refresh`.
+
+    If ``unpopulated`` is True, only the views still without data, e.g.
+    because they were synced ``WITH NO DATA``, are refreshed. They can't be
+    refreshed concurrently, and nobody can read them yet anyway. Snapshot
+    views reading from other views count as without data while empty.
+
+    Returns the list of refreshed views, in the order they finished.
+    """
+    if graph is None:
+        graph = ViewGraph(get_view_models(using))
+
+    levels = [
+        [view_cls for view_cls in level
+         if issubclass(view_cls, REFRESHED_VIEWS) and
+         (views is None or view_cls in views)]
+        for level in graph.levels]
+    if unpopulated:
+        with connections[using].cursor() as cursor:
+            states = get_view_states(cursor, [
+                view_cls._meta.db_table
+                for level in levels for view_cls in level])
+            unfilled = set(
+                name for name, state in states.items() if not state.populated)
+            unfilled.update(_empty_snapshots(cursor, graph, levels, states))
+        levels = [
+            [view_cls for view_cls in level
+             if view_cls._meta.db_table in unfilled]
+            for level in levels]
+        concurrently = False
+    levels = [level for level in levels if level]
+
+    refreshed = []
+    with trace('pgviews.refresh_views', concurrently=concurrently,
+               workers=workers, using=using):
+        if workers <= 1:
+            for level in levels:
+                for view_cls in level:
+                    refreshed.append(
+                        _refresh(view_cls, concurrently, using, options))
+            return refreshed
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for level in levels:
+                futures = [
+                    executor.submit(
+                        run_in_thread, using, _refresh, view_cls,
+                        concurrently, using, options)
+                    for view_cls in level]
+                # Wait for the whole level before moving on to its dependents.
+                for future in futures:
+                    refreshed.append(future.result())
+    return refreshed
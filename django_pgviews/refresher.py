@@ -0,0 +1,217 @@
+"""Refresh materialized views when the tables they read from change.
+
+Statement-level triggers on the source tables of every materialized view
+send a ``NOTIFY`` carrying the table's OID. The :class:`Refresher` listens
+for these, waits for bursts of changes to settle, and refreshes only the
+affected views and the views depending on them.
+"""
+import logging
+import select
+import time
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from django_pgviews.graph import ViewGraph, get_view_models, view_name
+from django_pgviews.introspection import get_source_tables
+from django_pgviews.refresh import REFRESHED_VIEWS, refresh_views
+
+
+log = logging.getLogger('django_pgviews.pgviews_refresher')
+
+NOTIFY_CHANNEL = 'pgviews_changed'
+NOTIFY_FUNCTION = 'public.pgviews_notify_changed'
+NOTIFY_TRIGGER = 'pgviews_notify_changed'
+
+# The longest to wait for notifications before checking the schedule.
+MAX_POLL_INTERVAL = 60.0
+
+
+def remove_triggers(cursor, keep=()):
+    """Remove the NOTIFY triggers from every table but those in ``keep``.
+
+    If no table is kept, the trigger function is removed as well.
+    """
+    cursor.execute(
+        'SELECT tgrelid::regclass::text FROM pg_trigger WHERE tgname = %s;',
+        [NOTIFY_TRIGGER])
+    for table, in cursor.fetchall():
+        if table not in keep:
+            cursor.execute('DROP TRIGGER {0} ON {1};'.format(
+                NOTIFY_TRIGGER, table))
+            log.info('pgviews_refresher no longer watching %s', table)
+    if not keep:
+        cursor.execute(
+            'DROP FUNCTION IF EXISTS {0}();'.format(NOTIFY_FUNCTION))
+
+
+class Refresher(object):
+    """Schedule refreshes of materialized views from change notifications.
+
+    A view with pending changes is refreshed once no change has arrived for
+    ``debounce`` seconds, but not sooner than its ``min_refresh_interval``
+    after its last refresh. A view with a ``max_refresh_interval`` is
+    refreshed at least that often, changes or not.
+
+    Views are refreshed on the ``using`` database, and ``graph`` defaults to
+    the installed views the database routers allow there.
+
+    Other ``options``, e.g. ``lock_timeout``, are passed on to
+    :meth:`~django_pgviews.view.MaterializedView.refresh`.
+
+    ``clock`` returns the current time in seconds and is only meant to be
+    replaced in tests.
+    """
+    def __init__(self, graph=None, debounce=1.0, concurrently=False,
+            workers=1, clock=time.monotonic, using=DEFAULT_DB_ALIAS,
+            **options):
+        if graph is None:
+            graph = ViewGraph(get_view_models(using))
+        self.graph = graph
+        self.using = using
+        self.views = [
+            view_cls for view_cls in graph.order
+            if issubclass(view_cls, REFRESHED_VIEWS)]
+        self.debounce = debounce
+        self.concurrently = concurrently
+        self.workers = workers
+        self.clock = clock
+        self.options = options
+
+        # Table OID -> views reading from it
+        self.sources = {}
+        # View -> time of its last change not yet refreshed
+        self.pending = {}
+        now = clock()
+        self.last_refresh = dict((view_cls, now) for view_cls in self.views)
+
+    def install(self, cursor):
+        """Find the source tables of every view and add NOTIFY triggers.
+
+        Source tables are the ``refresh_sources`` models of a view, or the
+        tables found through ``pg_depend`` if it doesn't declare any. The
+        triggers of tables no view reads from any more are removed.
+        """
+        tables = {}
+        for view_cls in self.views:
+            if view_cls._refresh_sources is not None:
+                found = []
+                for label in view_cls._refresh_sources:
+                    table = apps.get_model(label)._meta.db_table
+                    cursor.execute(
+                        'SELECT %s::regclass::oid::bigint, %s::regclass::text;',
+                        [table, table])
+                    found.append(cursor.fetchone())
+            else:
+                found = get_source_tables(cursor, view_cls._meta.db_table)
+            for oid, table in found:
+                tables[oid] = table
+                self.sources.setdefault(oid, set()).add(view_cls)
+
+        remove_triggers(cursor, keep=set(tables.values()))
+        cursor.execute(
+            """CREATE OR REPLACE FUNCTION {0}() RETURNS trigger
+            LANGUAGE plpgsql AS $pgviews$
+            BEGIN
+                PERFORM pg_notify('{1}', TG_RELID::text);
+                RETURN NULL;
+            END;
+            $pgviews$;""".format(NOTIFY_FUNCTION, NOTIFY_CHANNEL))
+        for table in tables.values():
+            cursor.execute('DROP TRIGGER IF EXISTS {0} ON {1};'.format(
+                NOTIFY_TRIGGER, table))
+            cursor.execute(
+                'CREATE TRIGGER {0} '
+                'AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {1} '
+                'FOR EACH STATEMENT EXECUTE PROCEDURE {2}();'.format(
+                    NOTIFY_TRIGGER, table, NOTIFY_FUNCTION))
+            log.info('pgviews_refresher watching %s', table)
+
+    def notify(self, payload):
+        """Record a change to the table whose OID is ``payload``.
+        """
+        now = self.clock()
+        for view_cls in self.sources.get(int(payload), ()):
+            self.pending[view_cls] = now
+
+    def next_due(self, view_cls):
+        """Return the time ``view_cls`` is next due for a refresh, or None.
+        """
+        due = []
+        if view_cls in self.pending:
+            due.append(max(
+                self.pending[view_cls] + self.debounce,
+                self.last_refresh[view_cls] + view_cls._min_refresh_interval))
+        if view_cls._max_refresh_interval is not None:
+            due.append(
+                self.last_refresh[view_cls] + view_cls._max_refresh_interval)
+        return min(due) if due else None
+
+    def due_views(self):
+        """Return the views that are due, and the views depending on them.
+        """
+        now = self.clock()
+        due = [
+            view_cls for view_cls in self.views
+            if self.next_due(view_cls) is not None and
+            self.next_due(view_cls) <= now]
+        return [
+            view_cls for view_cls in self.graph.downstream(due)
+            if issubclass(view_cls, REFRESHED_VIEWS)]
+
+    def refresh_due(self):
+        """Refresh the views that are due, in dependency order.
+        """
+        views = self.due_views()
+        if not views:
+            return []
+        # Changes arriving during the refresh may not be included, so only
+        # forget the changes that came before it.
+        started = self.clock()
+        refreshed = refresh_views(
+            self.graph, views=views, concurrently=self.concurrently,
+            workers=self.workers, using=self.using, **self.options)
+        for view_cls in refreshed:
+            self.last_refresh[view_cls] = started
+            if self.pending.get(view_cls, started) < started:
+                del self.pending[view_cls]
+        return refreshed
+
+    def timeout(self):
+        """Return how long to wait for notifications before the next refresh.
+        """
+        due = [self.next_due(view_cls) for view_cls in self.views]
+        due = [when for when in due if when is not None]
+        if not due:
+            return MAX_POLL_INTERVAL
+        return min(MAX_POLL_INTERVAL, max(0, min(due) - self.clock()))
+
+    def run(self):
+        """Install the triggers, then listen and refresh forever.
+        """
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            self.install(cursor)
+
+        # Listen on a connection of our own, so refreshes don't hold up
+        # notifications.
+        listener = connection.get_new_connection(
+            connection.get_connection_params())
+        listener.autocommit = True
+        try:
+            listener.cursor().execute('LISTEN {0};'.format(NOTIFY_CHANNEL))
+            while True:
+                if select.select([listener], [], [], self.timeout())[0]:
+                    listener.poll()
+                    while listener.notifies:
+                        self.notify(listener.notifies.pop(0).payload)
+                try:
+                    for view_cls in self.refresh_due():
+                        log.debug('pgview %s refreshed by pgviews_refresher',
+                                  view_name(view_cls))
+                except Exception:
+                    log.exception('pgviews_refresher failed to refresh views')
+                    # Don't retry straight away.
+                    time.sleep(max(self.debounce, 1.0))
+        finally:
+            listener.close()
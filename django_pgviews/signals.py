@@ -2,5 +2,8 @@ from django.dispatch import Signal
 
 
 view_synced = Signal(
-    providing_args=['update', 'force', 'status', 'has_changed'])
-all_views_synced = Signal()
+    providing_args=[
+        'update', 'force', 'status', 'has_changed', 'duration', 'using'])
+all_views_synced = Signal(providing_args=['using'])
+view_refreshed = Signal(
+    providing_args=['concurrently', 'duration', 'rows', 'using', 'attempts'])
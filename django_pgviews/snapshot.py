@@ -0,0 +1,245 @@
+"""Snapshot views, tables kept in step with a query by keyed upserts.
+
+A :class:`SnapshotView` is backed by a regular table holding the rows of its
+``sql``, with a primary key on its ``key`` fields. A refresh computes the
+query and only writes the rows that differ: new keys are inserted, changed
+rows updated and keys gone from the result deleted. Unchanged rows are left
+alone, so the WAL a refresh writes follows the size of the change rather
+than the size of the result, and readers are never locked out.
+"""
+import logging
+import time
+
+from django.core import exceptions
+from django.db import OperationalError, connections, router, transaction
+
+from django_pgviews.db.batch import StatementBatch
+from django_pgviews.db.timeouts import (
+    execute_with_timeouts, lock_not_available, retry_delay)
+from django_pgviews.introspection import get_view_states
+from django_pgviews.locks import advisory_lock, get_lock_mode, view_lock
+from django_pgviews.signals import view_refreshed
+from django_pgviews.tracing import trace
+from django_pgviews.view import (
+    BaseManagerMeta, FINGERPRINT_PREFIX, ReadOnlyView, RebuildPlan,
+    storage_clause, view_fingerprint)
+
+
+log = logging.getLogger('django_pgviews.view')
+
+
+class SnapshotSQL(object):
+    """The SQL that creates and refreshes the table of a snapshot view.
+    """
+    def __init__(self, view_cls, connection):
+        if not view_cls.key:
+            raise exceptions.ImproperlyConfigured(
+                '{0}.key must name the fields identifying its rows'.format(
+                    view_cls.__name__))
+        self.table = view_cls._meta.db_table
+        self.query = view_cls.sql.strip().rstrip(';')
+        self.columns = [f.column for f in view_cls._meta.concrete_fields]
+        self.keys = [
+            view_cls._meta.get_field(name).column for name in view_cls.key]
+        self.values = [
+            column for column in self.columns if column not in self.keys]
+        self.storage = storage_clause(
+            connection, view_cls._storage_parameters,
+            view_cls._meta.db_tablespace)
+
+    def select(self, where=None, escape=False):
+        """Select the columns of the view from its query.
+
+        If ``escape`` is True, ``%`` in the query is escaped for a statement
+        with parameters.
+        """
+        query = escape and self.query.replace('%', '%%') or self.query
+        sql = 'SELECT {0} FROM ({1}) AS q'.format(
+            ', '.join(self.columns), query)
+        if where is not None:
+            sql += ' WHERE {0}'.format(where)
+        return sql
+
+    def _match(self, left, right):
+        return ' AND '.join(
+            '{0}.{2} = {1}.{2}'.format(left, right, key) for key in self.keys)
+
+    def create_statements(self, with_data=True):
+        """Return the statements creating and filling the table.
+
+        The primary key is added once the table is filled, which is quicker
+        than maintaining it row by row, and fails on null keys. If
+        ``with_data`` is False, the table is left empty.
+        """
+        return [
+            'CREATE TABLE {0}{1} AS {2}{3};'.format(
+                self.table, self.storage, self.select(),
+                not with_data and ' WITH NO DATA' or ''),
+            'ALTER TABLE {0} ADD PRIMARY KEY ({1});'.format(
+                self.table, ', '.join(self.keys)),
+        ]
+
+    def drop_statements(self):
+        return ['DROP TABLE IF EXISTS {0} CASCADE;'.format(self.table)]
+
+    def refresh(self, where=None, escape=False):
+        """Return the statement applying the changes to the table.
+
+        The result is computed once, as ``n``. Only its rows that are new or
+        differ from the table are upserted, so unchanged rows are not even
+        locked. ``where`` restricts both the result and the rows that may be
+        deleted. The statement returns the number of rows in the result,
+        written and deleted. ``escape`` is as for :meth:`select`, and the
+        parameters of ``where`` are needed twice.
+        """
+        if self.values:
+            changed = 'o.{0} IS NULL OR ({1}) IS DISTINCT FROM ({2})'.format(
+                self.keys[0],
+                ', '.join('o.' + column for column in self.values),
+                ', '.join('n.' + column for column in self.values))
+            conflict = 'DO UPDATE SET {0}'.format(', '.join(
+                '{0} = EXCLUDED.{0}'.format(column)
+                for column in self.values))
+        else:
+            changed = 'o.{0} IS NULL'.format(self.keys[0])
+            conflict = 'DO NOTHING'
+        deleted = 'NOT EXISTS (SELECT 1 FROM n WHERE {0})'.format(
+            self._match('n', 'q'))
+        if where is not None:
+            deleted = '({0}) AND {1}'.format(where, deleted)
+        return (
+            'WITH n AS ({0}),\n'
+            'deleted AS (DELETE FROM {1} AS q WHERE {2} RETURNING 1),\n'
+            'written AS (INSERT INTO {1} AS s ({3}) '
+            'SELECT {4} FROM n LEFT JOIN {1} AS o ON {5} WHERE {6} '
+            'ON CONFLICT ({7}) {8} RETURNING 1)\n'
+            'SELECT (SELECT count(*) FROM n), (SELECT count(*) FROM written), '
+            '(SELECT count(*) FROM deleted);').format(
+                self.select(where, escape), self.table, deleted,
+                ', '.join(self.columns),
+                ', '.join('n.' + column for column in self.columns),
+                self._match('o', 'n'), changed, ', '.join(self.keys),
+                conflict)
+
+
+def create_snapshot_view(connection, view_cls, update=True, snapshot=None,
+        batch=None, plan=None, with_data=True):
+    """
+    Create and fill the table of a :class:`SnapshotView`.
+
+    Returns ``CREATED`` or ``UPDATED`` if the table was (re)built, or
+    ``EXISTS`` or ``UNCHANGED`` if nothing was done. ``snapshot``, ``batch``,
+    ``plan`` and ``with_data`` are as for
+    :func:`~django_pgviews.view.create_view`, except that a table without
+    data is empty rather than unreadable, and filled by its next refresh.
+    """
+    if batch is None:
+        with transaction.atomic(using=connection.alias), \
+                connection.cursor() as cursor:
+            return create_snapshot_view(
+                connection, view_cls, update=update, snapshot=snapshot,
+                batch=StatementBatch(cursor), plan=plan, with_data=with_data)
+    if plan is None:
+        plan = RebuildPlan()
+
+    sql = SnapshotSQL(view_cls, connection)
+    statements = sql.create_statements()
+    fingerprint = FINGERPRINT_PREFIX + view_fingerprint(
+        '\n'.join(statements), columns=sql.columns)
+
+    if snapshot is None:
+        batch.flush()
+        snapshot = get_view_states(batch.cursor, [sql.table])
+    state = snapshot.get(sql.table)
+    if state is not None and not update:
+        return 'EXISTS'
+    elif state is not None and state.comment == fingerprint:
+        return 'UNCHANGED'
+
+    if state is not None:
+        plan.drop(batch, sql.table, state.kind)
+    for statement in sql.create_statements(with_data):
+        batch.execute(statement)
+    batch.execute('COMMENT ON TABLE {0} IS %s;'.format(sql.table),
+                  [fingerprint])
+    plan.created(batch, sql.table, populated=with_data)
+    return state is not None and 'UPDATED' or 'CREATED'
+
+
+def clear_snapshot_view(connection, view_cls):
+    """
+    Remove the table of a :class:`SnapshotView`.
+    """
+    with connection.cursor() as cursor:
+        for statement in SnapshotSQL(view_cls, connection).drop_statements():
+            cursor.execute(statement)
+    return u'DROPPED'
+
+
+class SnapshotView(ReadOnlyView):
+    """A view stored in a table, refreshed by applying only what changed.
+
+    Set ``key`` to the names of the fields identifying a row of ``sql``.
+    They must be unique and non-null in the result of the query.
+    """
+    key = ()
+
+    @classmethod
+    def refresh(cls, concurrently=False, using=None, where=None, params=None,
+            lock_timeout=None, statement_timeout=None, retries=0,
+            backoff=0.5, strict=False, lock=None):
+        """Bring the table up to date with the query, and send
+        ``view_refreshed``.
+
+        Readers are never locked out, so the refresh always counts as
+        concurrent, and ``concurrently`` and ``strict`` make no difference.
+        ``where`` is an SQL condition on the columns of the view, with
+        ``params``, restricting the refresh to the rows it matches, e.g.
+        ``refresh(where='customer_id = %s', params=[42])``. The other options
+        are as for :meth:`~django_pgviews.view.MaterializedView.refresh`.
+
+        Returns the number of rows in the view, or None when refreshing only
+        part of it.
+        """
+        if using is None:
+            using = router.db_for_write(cls)
+        connection = connections[using]
+        sql = SnapshotSQL(cls, connection)
+        statement = sql.refresh(where, escape=params is not None)
+        lock = get_lock_mode('PGVIEWS_REFRESH_LOCK', lock)
+        with advisory_lock(connection, view_lock(cls), lock) as acquired:
+            if not acquired:
+                log.info('pgview %s is being refreshed by another process, '
+                         'skipping', cls.__name__)
+                return None
+            with trace('pgviews.refresh', view=sql.table, concurrently=True,
+                       statement=statement, using=using) as span:
+                attempts = 0
+                while True:
+                    attempts += 1
+                    try:
+                        result, written, deleted = execute_with_timeouts(
+                            connection, statement, lock_timeout=lock_timeout,
+                            statement_timeout=statement_timeout,
+                            params=list(params) * 2
+                            if params is not None else None, fetch=True)
+                        break
+                    except OperationalError as exc:
+                        if attempts > retries or not lock_not_available(exc):
+                            raise
+                        time.sleep(retry_delay(cls, backoff, attempts))
+                rows = result if where is None else None
+                span.set_attribute('rows', rows)
+                span.set_attribute('written', written)
+                span.set_attribute('deleted', deleted)
+                span.set_attribute('attempts', attempts)
+        log.debug('pgview %s wrote %d rows and deleted %d', cls.__name__,
+                  written, deleted)
+        view_refreshed.send(
+            sender=cls, concurrently=True, duration=span.duration, rows=rows,
+            using=using, attempts=attempts)
+        return rows
+
+    class Meta(BaseManagerMeta):
+        abstract = True
+        managed = False
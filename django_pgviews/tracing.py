@@ -0,0 +1,73 @@
+"""Timing and tracing of sync and refresh steps.
+
+Every step runs in a :class:`Span`, which times it and collects attributes
+such as the view and the rows affected. Spans are handed to the tracer named
+by the ``PGVIEWS_TRACER`` setting, the dotted path of a :class:`Tracer`
+subclass, e.g. one forwarding them to OpenTelemetry. The default tracer
+does nothing.
+"""
+import contextlib
+import functools
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Span(object):
+    """A timed step of a sync or refresh.
+
+    ``duration`` is the wall time in seconds, set once the step has ended.
+    """
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start = None
+        self.duration = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class Tracer(object):
+    """Receives the spans of sync and refresh steps. Does nothing.
+    """
+    def start_span(self, span):
+        """Called when a step starts.
+        """
+
+    def end_span(self, span, exc=None):
+        """Called when a step ends, with the exception if it failed.
+        """
+
+
+@functools.lru_cache(maxsize=None)
+def _load_tracer(path):
+    return import_string(path)()
+
+
+def get_tracer():
+    """Return the tracer from the ``PGVIEWS_TRACER`` setting.
+    """
+    path = getattr(settings, 'PGVIEWS_TRACER', None)
+    if path is None:
+        return Tracer()
+    return _load_tracer(path)
+
+
+@contextlib.contextmanager
+def trace(name, **attributes):
+    """Run the body of the ``with`` statement in a new span.
+    """
+    tracer = get_tracer()
+    span = Span(name, attributes)
+    span.start = time.monotonic()
+    tracer.start_span(span)
+    try:
+        yield span
+    except Exception as exc:
+        span.duration = time.monotonic() - span.start
+        tracer.end_span(span, exc)
+        raise
+    span.duration = time.monotonic() - span.start
+    tracer.end_span(span)
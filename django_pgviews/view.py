@@ -2,19 +2,31 @@
 """
 import collections
 import copy
+import hashlib
 import logging
 import re
+import time
 
 import django
 from django.core import exceptions
-from django.db import connection, transaction
+from django.db import (
+    OperationalError, ProgrammingError, connections, router, transaction)
 from django.db.models.query import QuerySet
 from django.db import models
+from psycopg2 import errorcodes
 import six
 from django.apps import apps
-import psycopg2
 
 from django_pgviews.db import get_fields_by_name
+from django_pgviews.db.batch import RecordingBatch, StatementBatch
+from django_pgviews.db.timeouts import (
+    execute_with_timeouts, lock_not_available, retry_delay)
+from django_pgviews.introspection import (
+    columns_compatible, describe_query, get_dependent_views, get_view_states,
+    has_extension, split_view_name)
+from django_pgviews.locks import advisory_lock, get_lock_mode, view_lock
+from django_pgviews.signals import view_refreshed
+from django_pgviews.tracing import trace
 
 
 FIELD_SPEC_REGEX = (r'^([A-Za-z_][A-Za-z0-9_]*)\.'
@@ -22,6 +34,17 @@ FIELD_SPEC_REGEX = (r'^([A-Za-z_][A-Za-z0-9_]*)\.'
                     r'(\*|(?:[A-Za-z_][A-Za-z0-9_]*))$')
 FIELD_SPEC_RE = re.compile(FIELD_SPEC_REGEX)
 
+# Materialized views rebuilt with ``swap`` are built under a shadow name with
+# this suffix, then renamed.
+SHADOW_SUFFIX = '__pgviews_new'
+
+# Views synced by pgviews carry a comment holding a fingerprint of their
+# definition, so unchanged views can be skipped on the next sync.
+FINGERPRINT_PREFIX = 'django_pgviews:'
+
+# pg_class.relkind -> the name of the kind of relation in DDL
+RELKINDS = {'v': 'VIEW', 'm': 'MATERIALIZED VIEW', 'r': 'TABLE'}
+
 log = logging.getLogger('django_pgviews.view')
 
 
@@ -64,86 +87,474 @@ def realize_deferred_projections(sender, *args, **kwargs):
 models.signals.class_prepared.connect(realize_deferred_projections)
 
 
-@transaction.atomic()
+def view_fingerprint(view_query, materialized=False, index=None, columns=(),
+        indexes=(), index_options=''):
+    """Return a hash of everything that defines a view in the database.
+
+    Leading and trailing whitespace and a trailing semicolon do not count as
+    a change. The rest of the SQL is hashed as it is, since whitespace can
+    matter inside literals, quoted names and comments. ``indexes`` are the
+    statements creating the view's other indexes, and ``index_options`` the
+    storage clauses of the unique ``index``.
+
+        >>> view_fingerprint('SELECT 1;') == view_fingerprint(' SELECT 1 ')
+        True
+    """
+    query = view_query.strip().rstrip(';').strip()
+    if index is not None:
+        index = ','.join(s.strip() for s in index.split(','))
+    parts = [
+        query,
+        materialized and 'materialized' or 'view',
+        index or '',
+        ','.join(columns),
+    ]
+    if index_options:
+        # Only when set, so the fingerprints of other views stay the same.
+        parts.append(index_options)
+    parts.extend(indexes)
+    return hashlib.sha1(u'\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def get_fingerprint(connection, view_name, view_query, materialized=False,
+        index=None, columns=(), indexes=(), index_storage=None,
+        index_tablespace=None):
+    """Return the comment :func:`create_view` tags a view with.
+    """
+    return FINGERPRINT_PREFIX + view_fingerprint(
+        view_query, materialized=materialized, index=index, columns=columns,
+        indexes=[
+            view_index.sql(connection, view_name) for view_index in indexes],
+        index_options=index is not None and storage_clause(
+            connection, index_storage, index_tablespace) or '')
+
+
+def storage_options(parameters):
+    """Return storage ``parameters`` as the ``name=value`` strings of
+    ``pg_class.reloptions``.
+    """
+    return [
+        '{0}={1}'.format(name, value if not isinstance(value, bool)
+                         else str(value).lower())
+        for name, value in sorted((parameters or {}).items())]
+
+
+def storage_clause(connection, parameters=None, tablespace=None):
+    """Return the ``WITH`` and ``TABLESPACE`` clauses storing a relation
+    with ``parameters`` in ``tablespace``.
+    """
+    clause = ''
+    if parameters:
+        clause += ' WITH ({0})'.format(', '.join(storage_options(parameters)))
+    if tablespace:
+        clause += ' ' + connection.ops.tablespace_sql(tablespace)
+    return clause
+
+
+class RebuildPlan(object):
+    """Drop and recreate the views depending on views being rebuilt.
+
+    Rather than dropping a view with ``CASCADE``, the views depending on it
+    are found through ``pg_depend`` and dropped first, deepest first. They
+    are recreated from their current definitions, with their indexes and
+    comments, as soon as every relation they read from exists again.
+
+    ``expected`` maps the ``(schema, name)`` of views that will be synced
+    later to the comment they will be tagged with. A dependent whose comment
+    differs is left for its own sync rather than recreated.
+
+    ``unpopulated`` holds the ``(schema, name)`` of the views that can't be
+    read, because they are materialized views without data or read from
+    one. A materialized view reading from one can't be filled either, and is
+    recreated ``WITH NO DATA``.
+    """
+    def __init__(self, expected=None):
+        self.expected = dict(expected or {})
+        # (schema, name) -> DependentView, dropped and not yet recreated
+        self.pending = collections.OrderedDict()
+        # (schema, name) of every relation dropped and not yet recreated
+        self.missing = set()
+        self.unpopulated = set()
+
+    def drop(self, batch, view_name, kind):
+        """Drop ``view_name`` and the views depending on it.
+
+        ``kind`` is the ``pg_class.relkind`` of ``view_name``.
+        """
+        batch.flush()
+        dependents = get_dependent_views(batch.cursor, view_name)
+        for dependent in reversed(dependents):
+            batch.execute('DROP {0} IF EXISTS {1};'.format(
+                RELKINDS[dependent.kind], dependent.name))
+        for dependent in dependents:
+            self.pending.setdefault(dependent.key, dependent)
+            self.missing.add(dependent.key)
+        batch.execute('DROP {0} {1};'.format(RELKINDS[kind], view_name))
+        self.missing.add(split_view_name(view_name))
+
+    def created(self, batch, view_name, populated=True):
+        """Recreate the views that only waited for ``view_name``.
+
+        ``populated`` is False if ``view_name`` was created without data.
+        """
+        key = split_view_name(view_name)
+        self.pending.pop(key, None)
+        self.missing.discard(key)
+        self.set_populated(key, populated)
+        progress = True
+        while progress:
+            progress = False
+            for key, dependent in list(self.pending.items()):
+                if (key in self.expected and
+                        self.expected[key] != dependent.comment):
+                    continue
+                if self.missing.intersection(dependent.references):
+                    continue
+                self.recreate(batch, dependent)
+                del self.pending[key]
+                self.missing.discard(key)
+                progress = True
+
+    def set_populated(self, key, populated):
+        if populated:
+            self.unpopulated.discard(key)
+        else:
+            self.unpopulated.add(key)
+
+    def recreate(self, batch, dependent):
+        kind = RELKINDS[dependent.kind]
+        readable = not self.unpopulated.intersection(dependent.references)
+        if dependent.kind == 'm':
+            readable = readable and dependent.populated
+        batch.execute('CREATE {0} {1}{2} AS {3}{4};'.format(
+            kind, dependent.name, dependent.storage,
+            dependent.definition.strip().rstrip(';'),
+            dependent.kind == 'm' and not readable and '\nWITH NO DATA' or ''))
+        self.set_populated(dependent.key, readable)
+        for index_sql in dependent.indexes:
+            batch.execute(index_sql)
+        if dependent.comment is not None:
+            batch.execute('COMMENT ON {0} {1} IS %s;'.format(
+                kind, dependent.name), [dependent.comment])
+
+
+class ViewIndex(object):
+    """An index from the ``Meta.indexes`` of a materialized view.
+
+    The SQL comes from Django, so any index class and option the installed
+    Django version supports can be used.
+    """
+    def __init__(self, model, index):
+        self.model = model
+        self.index = index
+
+    @property
+    def name(self):
+        return self.index.name
+
+    def sql(self, connection, table, name=None):
+        """Return the statement creating the index on ``table``.
+
+        ``name`` replaces the name of the index if given.
+        """
+        editor = connection.schema_editor()
+        sql = str(self.index.create_sql(self.model, editor))
+        sql = sql.replace(editor.quote_name(self.model._meta.db_table), table)
+        if name is not None:
+            sql = sql.replace(
+                editor.quote_name(self.index.name), editor.quote_name(name), 1)
+        return sql
+
+
+class Maintenance(object):
+    """What to do to a materialized view every time it has been filled.
+
+    ``analyze`` is True, or a dict mapping columns to their statistics
+    target, to gather planner statistics. ``cluster`` names an index from
+    ``Meta.indexes`` to order the rows by, and ``prewarm`` loads the view
+    and its indexes into the buffer cache, if ``pg_prewarm`` is installed.
+    """
+    def __init__(self, analyze=False, cluster=None, prewarm=False):
+        self.analyze = analyze
+        self.cluster = cluster
+        self.prewarm = prewarm
+
+    def __bool__(self):
+        return bool(self.analyze or self.cluster or self.prewarm)
+
+    __nonzero__ = __bool__
+
+    def statements(self, connection, table, prewarm, cluster_index=None):
+        """Return the ``(action, sql)`` pairs to run on ``table``, in order.
+
+        ``prewarm`` is whether ``pg_prewarm`` is installed, and
+        ``cluster_index`` replaces the name of the index to cluster on.
+        """
+        quote_name = connection.ops.quote_name
+        statements = []
+        # Rows are reordered first, so the statistics see their order.
+        if self.cluster:
+            statements.append(('cluster', 'CLUSTER {0} USING {1};'.format(
+                table, quote_name(cluster_index or self.cluster))))
+        if self.analyze:
+            targets = isinstance(self.analyze, dict) and self.analyze or {}
+            for column, target in sorted(targets.items()):
+                statements.append((
+                    'statistics',
+                    'ALTER MATERIALIZED VIEW {0} ALTER COLUMN {1} '
+                    'SET STATISTICS {2:d};'.format(
+                        table, quote_name(column), target)))
+            statements.append(('analyze', 'ANALYZE {0};'.format(table)))
+        if self.prewarm and prewarm:
+            statements.append((
+                'prewarm',
+                "SELECT sum(pg_prewarm(r.oid)) FROM ("
+                "SELECT '{0}'::regclass AS oid UNION ALL "
+                "SELECT indexrelid FROM pg_index "
+                "WHERE indrelid = '{0}'::regclass) r;".format(table)))
+        return statements
+
+    def run(self, connection, execute, table, cursor, cluster_index=None):
+        """Run the statements for ``table`` through ``execute``, each in a
+        ``pgviews.maintain`` span.
+
+        ``cursor`` is used to check whether ``pg_prewarm`` is installed.
+        """
+        prewarm = self.prewarm and has_extension(cursor, 'pg_prewarm')
+        for action, sql in self.statements(
+                connection, table, prewarm, cluster_index):
+            with trace('pgviews.maintain', view=table, action=action,
+                       statement=sql):
+                execute(sql)
+
+
 def create_view(connection, view_name, view_query, update=True, force=False,
-        materialized=False, index=None):
+        materialized=False, index=None, columns=(), snapshot=None, batch=None,
+        swap=False, indexes=(), plan=None, with_data=True, maintenance=None,
+        storage=None, tablespace=None, index_storage=None,
+        index_tablespace=None):
     """
     Create a named view on a connection.
 
-    Returns True if a new view was created (or an existing one updated), or
-    False if nothing was done.
+    Returns a status string: ``CREATED``, ``UPDATED``, ``FORCED`` if a view
+    was created or changed, ``ALTERED`` if only its storage was changed,
+    ``EXISTS``, ``UNCHANGED`` or ``FORCE_REQUIRED`` if nothing was done.
 
     If ``update`` is True (default), attempt to update an existing view. If the
     existing view's schema is incompatible with the new definition, ``force``
     (default: False) controls whether or not to drop the old view and create
     the new one.
+
+    The other options come from the view's model and the sync, see
+    :meth:`~django_pgviews.models.ViewSyncer.run` and the README. Without a
+    shared ``batch``, the view is created in its own transaction.
     """
+    fingerprint = get_fingerprint(
+        connection, view_name, view_query, materialized=materialized,
+        index=index, columns=columns, indexes=indexes,
+        index_storage=index_storage, index_tablespace=index_tablespace)
+    if plan is None:
+        plan = RebuildPlan()
+    options = dict(
+        view_name=view_name, view_query=view_query, update=update,
+        force=force, materialized=materialized, index=index, indexes=indexes,
+        fingerprint=fingerprint, snapshot=snapshot, swap=swap, plan=plan,
+        with_data=with_data, maintenance=maintenance or Maintenance(),
+        storage=storage, tablespace=tablespace,
+        index_options=storage_clause(
+            connection, index_storage, index_tablespace))
+
+    if batch is not None:
+        return _create_view(connection, batch, **options)
+
+    with transaction.atomic(using=connection.alias), \
+            connection.cursor() as cursor:
+        return _create_view(connection, StatementBatch(cursor), **options)
+
+
+def _create_view(connection, batch, view_name, view_query, update, force,
+        materialized, index, indexes, fingerprint, snapshot, swap, plan,
+        with_data, maintenance, storage, tablespace, index_options):
+    cursor = batch.cursor
+    force_required = False
+    # Determine if view already exists, and what it was last synced as.
+    if snapshot is None:
+        batch.flush()
+        snapshot = get_view_states(cursor, [view_name])
+    state = snapshot.get(view_name)
+    view_exists = state is not None
+    if view_exists and not update:
+        return 'EXISTS'
+    elif view_exists and state.comment == fingerprint:
+        if not materialized or state.kind != 'm':
+            return 'UNCHANGED'
+        statements = _alter_storage(
+            connection, view_name, state, storage, tablespace)
+        for sql in statements:
+            batch.execute(sql)
+        return statements and 'ALTERED' or 'UNCHANGED'
+    elif view_exists and not materialized:
+        # Detect schema conflict by comparing the columns of the new query
+        # with those of the existing view.
+        batch.flush()
+        if isinstance(batch, RecordingBatch):
+            # Only planning, so the query may read from views that are not
+            # created yet; then it is planned as a replacement.
+            try:
+                with transaction.atomic(using=connection.alias):
+                    columns = describe_query(cursor, view_query)
+            except ProgrammingError:
+                columns = state.columns
+        else:
+            columns = describe_query(cursor, view_query)
+        force_required = not columns_compatible(state.columns, columns)
+
+    if materialized and view_exists and swap and state.kind == 'm' and \
+            with_data:
+        _swap_materialized_view(
+            connection, batch, view_name, view_query, index, indexes, plan,
+            maintenance, storage_clause(connection, storage, tablespace),
+            index_options)
+        ret = 'UPDATED'
+    elif materialized:
+        if view_exists:
+            plan.drop(batch, view_name, state.kind)
+        query = view_query
+        if not with_data:
+            query = '{0}\nWITH NO DATA'.format(view_query.strip().rstrip(';'))
+        batch.execute('CREATE MATERIALIZED VIEW {0}{1} AS {2};'.format(
+            view_name, storage_clause(connection, storage, tablespace),
+            query))
+        _create_indexes(connection, batch, view_name, view_name, index, indexes,
+                        index_options=index_options)
+        if with_data:
+            maintenance.run(connection, batch.execute, view_name, cursor)
+        ret = view_exists and 'UPDATED' or 'CREATED'
+    elif not force_required and batch.deferred and not force:
+        # A failure here fails the whole batch.
+        batch.execute('CREATE OR REPLACE VIEW {0} AS {1};'.format(view_name, view_query))
+        ret = view_exists and 'UPDATED' or 'CREATED'
+    elif not force_required:
+        try:
+            with transaction.atomic(using=connection.alias):
+                batch.execute_now('CREATE OR REPLACE VIEW {0} AS {1};'.format(view_name, view_query))
+        except ProgrammingError:
+            # The column types match but their modifiers don't, e.g. the
+            # length of a varchar changed.
+            force_required = True
+        else:
+            ret = view_exists and 'UPDATED' or 'CREATED'
 
-    if '.' in view_name:
-        vschema, vname = view_name.split('.', 1)
-    else:
-        vschema, vname = 'public', view_name
+    if force_required and force:
+        plan.drop(batch, view_name, state.kind)
+        batch.execute('CREATE VIEW {0} AS {1};'.format(view_name, view_query))
+        ret = 'FORCED'
+    elif force_required:
+        return 'FORCE_REQUIRED'
 
-    cursor_wrapper = connection.cursor()
-    cursor = cursor_wrapper.cursor
-    try:
-        force_required = False
-        # Determine if view already exists.
-        cursor.execute(
-            'SELECT COUNT(*) FROM information_schema.views WHERE table_schema = %s and table_name = %s;',
-            [vschema, vname]
-        )
-        view_exists = cursor.fetchone()[0] > 0
-        if view_exists and not update:
-            return 'EXISTS'
-        elif view_exists:
-            # Detect schema conflict by copying the original view, attempting to
-            # update this copy, and detecting errors.
-            cursor.execute('CREATE TEMPORARY VIEW check_conflict AS SELECT * FROM {0};'.format(view_name))
-            try:
-                with transaction.atomic():
-                    cursor.execute('CREATE OR REPLACE TEMPORARY VIEW check_conflict AS {0};'.format(view_query))
-            except psycopg2.ProgrammingError:
-                force_required = True
-            finally:
-                cursor.execute('DROP VIEW IF EXISTS check_conflict;')
+    batch.execute('COMMENT ON {0} {1} IS %s;'.format(
+        materialized and 'MATERIALIZED VIEW' or 'VIEW', view_name),
+        [fingerprint])
+    plan.created(batch, view_name, populated=with_data)
+    return ret
 
-        if materialized:
-            cursor.execute('DROP MATERIALIZED VIEW IF EXISTS {0} CASCADE;'.format(view_name))
-            cursor.execute('CREATE MATERIALIZED VIEW {0} AS {1};'.format(view_name, view_query))
-            if index is not None:
-                index_sub_name = '_'.join([s.strip() for s in index.split(',')])
-                cursor.execute('CREATE UNIQUE INDEX {0}_{1}_index ON {0} ({2})'.format(
-                    view_name, index_sub_name, index))
-            ret = view_exists and 'UPDATED' or 'CREATED'
-        elif not force_required:
-            cursor.execute('CREATE OR REPLACE VIEW {0} AS {1};'.format(view_name, view_query))
-            ret = view_exists and 'UPDATED' or 'CREATED'
-        elif force:
-            cursor.execute('DROP VIEW IF EXISTS {0} CASCADE;'.format(view_name))
-            cursor.execute('CREATE VIEW {0} AS {1};'.format(view_name, view_query))
-            ret = 'FORCED'
-        else:
-            ret = 'FORCE_REQUIRED'
 
-        return ret
-    finally:
-        cursor_wrapper.close()
+def _alter_storage(connection, view_name, state, storage, tablespace):
+    """Return the statements bringing the storage of a materialized view
+    from its ``state`` to the declared one.
+    """
+    statements = []
+    options = storage_options(storage)
+    if storage is not None and sorted(options) != sorted(state.options):
+        reset = [
+            option.split('=', 1)[0] for option in state.options
+            if option.split('=', 1)[0] not in storage]
+        if reset:
+            statements.append('ALTER MATERIALIZED VIEW {0} RESET ({1});'.format(
+                view_name, ', '.join(reset)))
+        if options:
+            statements.append('ALTER MATERIALIZED VIEW {0} SET ({1});'.format(
+                view_name, ', '.join(options)))
+    if tablespace and tablespace != state.tablespace:
+        statements.append('ALTER MATERIALIZED VIEW {0} SET {1};'.format(
+            view_name, connection.ops.tablespace_sql(tablespace)))
+    return statements
+
+
+def _index_name(view_name, index):
+    """Return the name of the unique ``index`` of a materialized view.
+    """
+    index_sub_name = '_'.join([s.strip() for s in index.split(',')])
+    return '{0}_{1}_index'.format(split_view_name(view_name)[1], index_sub_name)
+
+
+def _shadow_name(name):
+    """Return the name to build ``name`` under before swapping it in.
+    """
+    return name[:63 - len(SHADOW_SUFFIX)] + SHADOW_SUFFIX
+
+
+def _create_indexes(connection, batch, table, view_name, index, indexes,
+        shadow=False, index_options=''):
+    """Create the indexes of materialized view ``view_name`` on ``table``.
+
+    If ``shadow`` is True, they are created under their shadow names.
+    ``index_options`` are the storage clauses of the unique index.
+    Returns a list of the ``(created, final)`` names of the indexes.
+    """
+    names = []
+    if index is not None:
+        name = _index_name(view_name, index)
+        created = shadow and _shadow_name(name) or name
+        batch.execute('CREATE UNIQUE INDEX {0} ON {1} ({2}){3};'.format(
+            created, table, index, index_options))
+        names.append((created, name))
+    quote_name = connection.ops.quote_name
+    for view_index in indexes:
+        created = shadow and _shadow_name(view_index.name) or view_index.name
+        batch.execute(view_index.sql(connection, table, created))
+        names.append((quote_name(created), quote_name(view_index.name)))
+    return names
+
+
+def _swap_materialized_view(connection, batch, view_name, view_query, index,
+        indexes, plan, maintenance, storage='', index_options=''):
+    """Rebuild a materialized view under a shadow name and swap it in.
+
+    The old view stays readable while the new one is built, indexed and
+    analyzed; it is only locked once it is dropped at the end.
+    """
+    vschema, vname = split_view_name(view_name)
+    shadow = '{0}.{1}'.format(vschema, _shadow_name(vname))
+    batch.execute('DROP MATERIALIZED VIEW IF EXISTS {0} CASCADE;'.format(shadow))
+    batch.execute('CREATE MATERIALIZED VIEW {0}{1} AS {2};'.format(
+        shadow, storage, view_query))
+    index_names = _create_indexes(
+        connection, batch, shadow, view_name, index, indexes, shadow=True,
+        index_options=index_options)
+    if not maintenance.analyze:
+        batch.execute('ANALYZE {0};'.format(shadow))
+    maintenance.run(
+        connection, batch.execute, shadow, batch.cursor,
+        cluster_index=maintenance.cluster and
+        _shadow_name(maintenance.cluster))
+
+    plan.drop(batch, view_name, 'm')
+    batch.execute('ALTER MATERIALIZED VIEW {0} RENAME TO {1};'.format(shadow, vname))
+    for created, name in index_names:
+        batch.execute('ALTER INDEX {0}.{1} RENAME TO {2};'.format(
+            vschema, created, name))
 
 
 def clear_view(connection, view_name, materialized=False):
     """
     Remove a named view on connection.
     """
-    cursor_wrapper = connection.cursor()
-    cursor = cursor_wrapper.cursor
-    try:
+    with connection.cursor() as cursor:
         if materialized:
             cursor.execute('DROP MATERIALIZED VIEW IF EXISTS {0} CASCADE'.format(view_name))
         else:
             cursor.execute('DROP VIEW IF EXISTS {0} CASCADE'.format(view_name))
-    finally:
-        cursor_wrapper.close()
     return u'DROPPED'.format(view=view_name)
 
 
@@ -155,6 +566,16 @@ class ViewMeta(models.base.ModelBase):
         dependencies = attrs.pop('dependencies', [])
         projection = attrs.pop('projection', [])
         concurrent_index = attrs.pop('concurrent_index',None)
+        with_data = attrs.pop('with_data', True)
+        storage_parameters = attrs.pop('storage_parameters', None)
+        index_storage_parameters = attrs.pop('index_storage_parameters', None)
+        maintenance = Maintenance(
+            analyze=attrs.pop('analyze', False),
+            cluster=attrs.pop('cluster', None),
+            prewarm=attrs.pop('prewarm', False))
+        refresh_sources = attrs.pop('refresh_sources', None)
+        min_refresh_interval = attrs.pop('min_refresh_interval', 0)
+        max_refresh_interval = attrs.pop('max_refresh_interval', None)
 
         # Get projection
         deferred_projections = []
@@ -177,6 +598,18 @@ class ViewMeta(models.base.ModelBase):
         setattr(view_cls, '_dependencies', dependencies)
         # Materialized views can have an index allowing concurrent refresh
         setattr(view_cls, '_concurrent_index', concurrent_index)
+        # Materialized views can be filled by a refresh after syncing
+        setattr(view_cls, '_with_data', with_data)
+        # and are maintained once filled
+        setattr(view_cls, '_maintenance', maintenance)
+        # Storage parameters of materialized views and their unique index
+        setattr(view_cls, '_storage_parameters', storage_parameters)
+        setattr(view_cls, '_index_storage_parameters',
+                index_storage_parameters)
+        # Scheduling for pgviews_refresher
+        setattr(view_cls, '_refresh_sources', refresh_sources)
+        setattr(view_cls, '_min_refresh_interval', min_refresh_interval)
+        setattr(view_cls, '_max_refresh_interval', max_refresh_interval)
         for app_label, model_name, field_name in deferred_projections:
             model_spec = (app_label, model_name.lower())
 
@@ -243,6 +676,17 @@ class ReadOnlyViewQuerySet(QuerySet):
     def bulk_create(self, objs, batch_size=None):
         raise NotImplementedError("Not allowed")
 
+    def aiterator(self, chunk_size=2000):
+        """Iterate over the rows without blocking the event loop.
+
+        See :func:`django_pgviews.aio.aiterate`.
+        """
+        from django_pgviews.aio import aiterate
+        return aiterate(self, chunk_size=chunk_size)
+
+    def __aiter__(self):
+        return self.aiterator()
+
 
 class ReadOnlyViewManager(models.Manager):
     def get_queryset(self):
@@ -260,24 +704,156 @@ class ReadOnlyView(View):
         managed = False
 
 
+class ExclusiveRefreshError(Exception):
+    """A strict refresh would have locked readers out of the view.
+    """
+
+
+
+
+class ViewNotPopulatedError(OperationalError):
+    """A materialized view created ``WITH NO DATA`` was read before being
+    refreshed.
+    """
+
+
+def translate_not_populated(execute, sql, params, many, context):
+    """Raise :class:`ViewNotPopulatedError` for reads of views without data.
+
+    Installed as an execute wrapper on every Postgres connection.
+    """
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as exc:
+        if getattr(exc.__cause__, 'pgcode', None) != \
+                errorcodes.OBJECT_NOT_IN_PREREQUISITE_STATE or \
+                'has not been populated' not in str(exc):
+            raise
+        raise ViewNotPopulatedError(
+            '{0}; run refresh_pgviews --unpopulated to fill it'.format(
+                str(exc).strip())) from exc
+
+
+
+
+
+
 class MaterializedView(View):
     """A materialized view.
     More information:
     http://www.postgresql.org/docs/current/static/sql-creatematerializedview.html
     """
     @classmethod
-    def refresh(self, concurrently=False):
-        cursor_wrapper = connection.cursor()
-        cursor = cursor_wrapper.cursor
-        try:
-            if self._concurrent_index is not None and concurrently:
-                cursor.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY {0}'.format(
-                    self._meta.db_table))
-            else:
-                cursor.execute('REFRESH MATERIALIZED VIEW {0}'.format(
-                    self._meta.db_table))
-        finally:
-            cursor_wrapper.close()
+    def refresh(self, concurrently=False, using=None, lock_timeout=None,
+            statement_timeout=None, retries=0, backoff=0.5, strict=False,
+            lock=None):
+        """Refresh the view and send ``view_refreshed``.
+
+        The view is refreshed on the ``using`` database, by default the one
+        the database routers pick for writes to the view.
+
+        A view without a ``concurrent_index`` can't be refreshed
+        concurrently, and is refreshed exclusively instead, locking readers
+        out until the refresh commits. If ``strict`` is True,
+        :class:`ExclusiveRefreshError` is raised rather than refreshing
+        exclusively.
+
+        ``lock_timeout`` and ``statement_timeout`` are in seconds. A refresh
+        that can't get its lock in time is retried up to ``retries`` times,
+        after waiting a random time of up to ``backoff`` seconds, doubled
+        on every retry.
+
+        Processes refreshing the same view can take turns, see
+        :mod:`django_pgviews.locks`. ``lock`` overrides the
+        ``PGVIEWS_REFRESH_LOCK`` setting. If the refresh is skipped because
+        another process is refreshing the view, ``view_refreshed`` is not
+        sent.
+
+        The ``analyze``, ``cluster`` and ``prewarm`` of the view, see
+        :class:`Maintenance`, run straight after the refresh, with the same
+        timeouts, and count towards its duration. ``CLUSTER`` locks readers
+        out, so strict refreshes of a view with ``cluster`` raise
+        :class:`ExclusiveRefreshError`.
+
+        Returns the number of rows in the refreshed view, counted in the
+        same transaction as the refresh.
+        """
+        if using is None:
+            using = router.db_for_write(self)
+        concurrently, sql = self._refresh_statement(concurrently, strict)
+        counted = '{0};\nSELECT count(*) FROM {1};'.format(
+            sql, self._meta.db_table)
+        lock = get_lock_mode('PGVIEWS_REFRESH_LOCK', lock)
+        connection = connections[using]
+        with advisory_lock(connection, view_lock(self), lock) as acquired:
+            if not acquired:
+                log.info('pgview %s is being refreshed by another process, '
+                         'skipping', self.__name__)
+                return None
+            with trace('pgviews.refresh', view=self._meta.db_table,
+                       concurrently=concurrently, statement=sql,
+                       using=using) as span:
+                attempts = 0
+                while True:
+                    attempts += 1
+                    try:
+                        rows, = execute_with_timeouts(
+                            connection, counted, lock_timeout=lock_timeout,
+                            statement_timeout=statement_timeout, fetch=True)
+                        break
+                    except OperationalError as exc:
+                        if attempts > retries or not lock_not_available(exc):
+                            raise
+                        time.sleep(retry_delay(self, backoff, attempts))
+                span.set_attribute('rows', rows)
+                span.set_attribute('attempts', attempts)
+                with connection.cursor() as cursor:
+                    self._maintenance.run(
+                        connection, lambda sql: execute_with_timeouts(
+                            connection, sql, lock_timeout=lock_timeout,
+                            statement_timeout=statement_timeout),
+                        self._meta.db_table, cursor)
+        view_refreshed.send(
+            sender=self, concurrently=concurrently, duration=span.duration,
+            rows=rows, using=using, attempts=attempts)
+        return rows
+
+    @classmethod
+    def arefresh(self, concurrently=False, using=None, **options):
+        """Refresh the view without blocking the event loop.
+
+        Takes the same options as :meth:`refresh`, and returns a coroutine.
+        See :func:`django_pgviews.aio.arefresh`.
+        """
+        from django_pgviews.aio import arefresh
+        return arefresh(self, concurrently=concurrently, using=using, **options)
+
+    @classmethod
+    def _refresh_statement(self, concurrently, strict):
+        """Return whether the view can be refreshed concurrently, and the
+        statement refreshing it.
+        """
+        if concurrently and self._concurrent_index is None:
+            if strict:
+                raise ExclusiveRefreshError(
+                    '{0} has no concurrent_index and can only be refreshed '
+                    'exclusively'.format(self.__name__))
+            log.warning('pgview %s has no concurrent_index, refreshing it '
+                        'exclusively', self.__name__)
+            concurrently = False
+        elif strict and not concurrently:
+            raise ExclusiveRefreshError(
+                'strict refreshes of {0} must be concurrent'.format(
+                    self.__name__))
+        if strict and self._maintenance.cluster:
+            raise ExclusiveRefreshError(
+                '{0} is clustered after every refresh, locking readers '
+                'out'.format(self.__name__))
+        if concurrently:
+            sql = 'REFRESH MATERIALIZED VIEW CONCURRENTLY {0}'
+        else:
+            sql = 'REFRESH MATERIALIZED VIEW {0}'
+        return concurrently, sql.format(self._meta.db_table)
 
     class Meta:
         abstract = True
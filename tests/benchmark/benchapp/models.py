@@ -0,0 +1,115 @@
+"""Synthetic views for the benchmarks, shaped by ``settings.PGVIEWS_BENCH``.
+
+The views are spread evenly over ``depth`` levels. Views in the first level
+each read one group of rows from the source table, and every later view
+joins ``fanout`` views from the level before. A ``materialized`` fraction of
+them are materialized views.
+"""
+import random
+
+from django.conf import settings
+from django.db import models
+
+from django_pgviews import view
+
+
+SOURCE_TABLE = 'pgviews_bench_source'
+
+DEFAULTS = {
+    'views': 100,
+    'depth': 5,
+    'fanout': 2,
+    'materialized': 0.25,
+    'seed': 0,
+}
+
+
+def get_config():
+    return dict(DEFAULTS, **settings.PGVIEWS_BENCH)
+
+
+def view_specs(views, depth, fanout, materialized, seed=0):
+    """Return the levels of the view graph.
+
+    Each level is a list of ``(name, parents, materialized)``, where
+    ``parents`` are names of views in the level before.
+    """
+    rnd = random.Random(seed)
+    depth = max(1, min(depth, views))
+    levels = []
+    for level in range(depth):
+        size = views // depth + (level < views % depth and 1 or 0)
+        specs = []
+        for i in range(size):
+            name = 'View{0}_{1}'.format(level, i)
+            if levels:
+                previous = [spec[0] for spec in levels[-1]]
+                parents = rnd.sample(previous, min(fanout, len(previous)))
+            else:
+                parents = []
+            specs.append((name, parents, rnd.random() < materialized))
+        levels.append(specs)
+    return levels
+
+
+def view_sql(index, parents, groups):
+    """Return the SQL of a view, given the db_tables of its parents.
+    """
+    if not parents:
+        return 'SELECT id, grp, val FROM {0} WHERE grp = {1}'.format(
+            SOURCE_TABLE, index % groups)
+    vals = ' + '.join(
+        ['p0.val'] + ['COALESCE(p{0}.val, 0)'.format(i)
+                      for i in range(1, len(parents))])
+    joins = ''.join(
+        ' LEFT JOIN {0} AS p{1} ON p{1}.id = p0.id'.format(parent, i)
+        for i, parent in enumerate(parents) if i)
+    return 'SELECT p0.id, p0.grp, {0} AS val FROM {1} AS p0{2}'.format(
+        vals, parents[0], joins)
+
+
+def db_table(name):
+    return 'pgviews_bench_{0}'.format(name.lower())
+
+
+def make_view(name, parents, materialized, sql):
+    if materialized:
+        base = view.ReadOnlyMaterializedView
+    else:
+        base = view.ReadOnlyView
+    attrs = {
+        '__module__': __name__,
+        'sql': sql,
+        'dependencies': ['benchapp.{0}'.format(parent) for parent in parents],
+        'id': models.IntegerField(primary_key=True),
+        'grp': models.IntegerField(),
+        'val': models.FloatField(),
+        'Meta': type('Meta', (object,), {
+            'app_label': 'benchapp',
+            'db_table': db_table(name),
+            'managed': False,
+        }),
+    }
+    if materialized:
+        attrs['concurrent_index'] = 'id'
+    return type(name, (base,), attrs)
+
+
+def make_views(config):
+    """Create the view models, and return them with the number of groups.
+    """
+    levels = view_specs(
+        config['views'], config['depth'], config['fanout'],
+        config['materialized'], config['seed'])
+    groups = len(levels[0])
+    views = []
+    for specs in levels:
+        for index, (name, parents, materialized) in enumerate(specs):
+            sql = view_sql(index, [db_table(parent) for parent in parents],
+                           groups)
+            views.append(make_view(name, parents, materialized, sql))
+    return groups, views
+
+
+# Number of row groups in the source table, one per view in the first level
+GROUPS, VIEWS = make_views(get_config())
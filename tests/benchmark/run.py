@@ -0,0 +1,98 @@
+"""Benchmark syncing and refreshing generated projects of views.
+
+Every combination of the given sizes and shapes is benchmarked in its own
+process, against the database named by the libpq environment variables
+(PGDATABASE defaults to pgviews_bench). The results are printed as a table,
+and written as JSON to --output for comparing releases.
+
+    python run.py --views 100,500,2000 --depth 3,10 --rows 1000000
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def run_scenario(config):
+    env = dict(os.environ, PGVIEWS_BENCH_CONFIG=json.dumps(config))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(HERE)), env.get('PYTHONPATH', '')])
+    output = subprocess.check_output(
+        [sys.executable, os.path.join(HERE, 'scenario.py')], env=env)
+    return json.loads(output.decode('utf-8'))
+
+
+def print_table(result):
+    print('{views} views ({materialized_views} materialized), '
+          'depth {depth}, fanout {fanout}, {rows} rows, '
+          'Postgres {server_version}'.format(
+              depth=result['config']['depth'],
+              fanout=result['config']['fanout'],
+              rows=result['config']['rows'],
+              **result))
+    print('  {0:<28} {1:>9} {2:>7} {3:>7} {4:>9} {5:>9}'.format(
+        'phase', 'seconds', 'trips', 'catalog', 'view p95', 'lock max'))
+    for phase in result['phases']:
+        print('  {0:<28} {1:>9.3f} {2:>7} {3:>7} {4:>9} {5:>9}'.format(
+            phase['phase'], phase['seconds'], phase['round_trips'],
+            phase['catalog_queries'],
+            format_seconds(phase['view_seconds_p95']),
+            format_seconds(phase['lock_hold_max_seconds'])))
+
+
+def format_seconds(value):
+    return value is None and '-' or '{0:.3f}'.format(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--views', type=int_list, default=[100, 500, 2000],
+                        help='Comma separated numbers of views.')
+    parser.add_argument('--depth', type=int_list, default=[5],
+                        help='Comma separated numbers of dependency levels.')
+    parser.add_argument('--fanout', type=int_list, default=[2],
+                        help='Comma separated numbers of views each view '
+                        'depends on.')
+    parser.add_argument('--materialized', type=float, default=0.25,
+                        help='Fraction of views that are materialized.')
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='Rows in the source table.')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Workers for the parallel refresh.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='File to write the JSON results to.')
+    args = parser.parse_args()
+
+    results = []
+    for views, depth, fanout in itertools.product(
+            args.views, args.depth, args.fanout):
+        result = run_scenario({
+            'views': views,
+            'depth': depth,
+            'fanout': fanout,
+            'materialized': args.materialized,
+            'rows': args.rows,
+            'workers': args.workers,
+            'seed': args.seed,
+        })
+        print_table(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'timestamp': time.time(), 'results': results}, output,
+                      indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Benchmark one generated project, and print the results as JSON.
+
+Run by run.py, with the shape of the project in PGVIEWS_BENCH_CONFIG.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import django  # noqa: E402
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from benchapp.models import GROUPS, SOURCE_TABLE, VIEWS, get_config  # noqa: E402
+from django_pgviews.models import ViewSyncer  # noqa: E402
+from django_pgviews.refresh import refresh_views  # noqa: E402
+from django_pgviews.signals import view_refreshed, view_synced  # noqa: E402
+from django_pgviews.view import MaterializedView  # noqa: E402
+
+
+CATALOG_RE = re.compile(
+    r'\bpg_(?:attribute|class|depend|index|namespace|rewrite)\b|'
+    r'\bpgviews_describe\b')
+
+
+class Phase(object):
+    """Measure one step: its time, the statements sent and view timings.
+
+    Statements are counted on the current thread's connection, so they are
+    not counted for parallel refreshes.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.round_trips = 0
+        self.catalog_queries = 0
+        self.view_seconds = []
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.round_trips += 1
+        if CATALOG_RE.search(sql):
+            self.catalog_queries += 1
+        return execute(sql, params, many, context)
+
+    def on_view(self, sender, duration, **kwargs):
+        with self.lock:
+            self.view_seconds.append(duration)
+
+    def run(self, func, **kwargs):
+        view_synced.connect(self.on_view)
+        view_refreshed.connect(self.on_view)
+        try:
+            with connection.execute_wrapper(self):
+                started = time.monotonic()
+                func(**kwargs)
+                self.seconds = time.monotonic() - started
+        finally:
+            view_synced.disconnect(self.on_view)
+            view_refreshed.disconnect(self.on_view)
+        return self
+
+    def result(self, lock_hold):
+        """Return the results, with how long exclusive locks were held.
+
+        ``lock_hold`` is ``'view'`` if each view's lock is only held while
+        it is handled, ``'phase'`` if all are held to the end of the phase,
+        or None if readers are never blocked.
+        """
+        seconds = sorted(self.view_seconds)
+        if lock_hold == 'phase':
+            lock_hold = self.seconds
+        elif lock_hold == 'view':
+            lock_hold = seconds and seconds[-1] or 0.0
+        return {
+            'phase': self.name,
+            'seconds': self.seconds,
+            'round_trips': self.round_trips,
+            'catalog_queries': self.catalog_queries,
+            'views': len(seconds),
+            'view_seconds_p50': percentile(seconds, 0.5),
+            'view_seconds_p95': percentile(seconds, 0.95),
+            'view_seconds_max': seconds and seconds[-1] or None,
+            'lock_hold_max_seconds': lock_hold,
+        }
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def create_source(rows):
+    with connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS {0} CASCADE;'.format(SOURCE_TABLE))
+        cursor.execute(
+            """CREATE TABLE {0} AS
+            SELECT g AS id, g % {1} AS grp, random() AS val
+            FROM generate_series(1, %s) AS g;""".format(SOURCE_TABLE, GROUPS),
+            [rows])
+        cursor.execute('ALTER TABLE {0} ADD PRIMARY KEY (id);'.format(
+            SOURCE_TABLE))
+        cursor.execute('ANALYZE {0};'.format(SOURCE_TABLE))
+
+
+def forget_fingerprints():
+    """Make every view look changed to the next sync.
+    """
+    with connection.cursor() as cursor:
+        for view_cls in VIEWS:
+            kind = issubclass(view_cls, MaterializedView) and \
+                'MATERIALIZED VIEW' or 'VIEW'
+            cursor.execute('COMMENT ON {0} {1} IS NULL;'.format(
+                kind, view_cls._meta.db_table))
+
+
+def sync(**kwargs):
+    ViewSyncer().run(force=True, update=True, **kwargs)
+
+
+def main():
+    config = get_config()
+    rows = config.get('rows', 1000000)
+    workers = config.get('workers', 4)
+
+    started = time.monotonic()
+    create_source(rows)
+    setup_seconds = time.monotonic() - started
+
+    phases = [
+        Phase('sync_cold').run(sync).result('view'),
+        Phase('sync_unchanged').run(sync).result('view'),
+    ]
+    forget_fingerprints()
+    phases.append(Phase('sync_changed').run(sync).result('view'))
+    forget_fingerprints()
+    phases.append(
+        Phase('sync_changed_swap').run(sync, swap=True).result('view'))
+    call_command('clear_pgviews')
+    phases.extend([
+        Phase('sync_cold_atomic').run(sync, atomic=True).result('phase'),
+        Phase('sync_unchanged_atomic').run(sync, atomic=True).result('phase'),
+        Phase('refresh').run(refresh_views).result('view'),
+        Phase('refresh_concurrent_parallel').run(
+            refresh_views, concurrently=True, workers=workers).result(None),
+    ])
+
+    with connection.cursor() as cursor:
+        cursor.execute('SHOW server_version;')
+        server_version = cursor.fetchone()[0]
+        cursor.execute('DROP TABLE {0} CASCADE;'.format(SOURCE_TABLE))
+
+    json.dump({
+        'config': dict(config, rows=rows, workers=workers),
+        'server_version': server_version,
+        'django_version': django.get_version(),
+        'views': len(VIEWS),
+        'materialized_views': len([
+            view_cls for view_cls in VIEWS
+            if issubclass(view_cls, MaterializedView)]),
+        'setup_seconds': setup_seconds,
+        'phases': phases,
+    }, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
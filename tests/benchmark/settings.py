@@ -0,0 +1,30 @@
+# Django settings for the django-pgviews benchmarks.
+#
+# The database is taken from the usual libpq environment variables, and the
+# shape of the generated views from PGVIEWS_BENCH_CONFIG, which run.py sets.
+import json
+import os
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'NAME': os.environ.get('PGDATABASE', 'pgviews_bench'),
+        'USER': os.environ.get('PGUSER', ''),
+        'PASSWORD': os.environ.get('PGPASSWORD', ''),
+        'HOST': os.environ.get('PGHOST', ''),
+        'PORT': os.environ.get('PGPORT', ''),
+    }
+}
+
+INSTALLED_APPS = (
+    'django_pgviews',
+    'benchapp',
+)
+
+SECRET_KEY = 'pgviews-bench'
+
+USE_TZ = True
+
+PGVIEWS_BENCH = json.loads(os.environ.get('PGVIEWS_BENCH_CONFIG', '{}'))
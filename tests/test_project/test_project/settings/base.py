@@ -1,4 +1,6 @@
 # Django settings for test_project project.
+import os
+import tempfile
 
 DEBUG = True
 TEMPLATE_DEBUG = DEBUG
@@ -20,7 +22,15 @@ DATABASES = {
         'PASSWORD': 'password',
         'HOST': 'localhost',                      # Empty for localhost through domain sockets or '127.0.0.1' for localhost through TCP.
         'PORT': '',                      # Set to empty string for default.
-    }
+    },
+    'other': {
+        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'NAME': 'django_pgviews_other',
+        'USER': 'django_pgviews',
+        'PASSWORD': 'password',
+        'HOST': 'localhost',
+        'PORT': '',
+    },
 }
 
 # Hosts/domain names that are valid for this site; required if DEBUG is False
@@ -167,3 +177,11 @@ LOGGING = {
         }
     }
 }
+
+# Shared between processes, as django_pgviews.cache requires.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'django_pgviews_test'),
+    },
+}
@@ -10,4 +10,12 @@ DATABASES = {
         'HOST': 'localhost',
         'PORT': '5432',
     },
+    'other': {
+        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'NAME': 'circle_test_other',
+        'USER': 'ubuntu',
+        'PASSWORD': ':',
+        'HOST': 'localhost',
+        'PORT': '5432',
+    },
 }
@@ -1,6 +1,8 @@
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 
-from django_pgviews import view
+from django_pgviews import aggregate, snapshot, view
+from django_pgviews.lookup import LookupTable
 
 
 class TestModel(models.Model):
@@ -36,6 +38,8 @@ class MaterializedRelatedView(view.ReadOnlyMaterializedView):
     sql = """SELECT id AS model_id, id FROM viewtest_testmodel"""
     model = models.ForeignKey(TestModel, on_delete=models.DO_NOTHING)
 
+    lookup = LookupTable()
+
 
 class DependantView(view.ReadOnlyView):
     dependencies = ('viewtest.RelatedView',)
@@ -49,9 +53,18 @@ class DependantMaterializedView(view.ReadOnlyMaterializedView):
 
 class MaterializedRelatedViewWithIndex(view.ReadOnlyMaterializedView):
     concurrent_index = 'id'
+    storage_parameters = {'fillfactor': 70}
     sql = """SELECT id AS model_id, id FROM viewtest_testmodel"""
     model = models.ForeignKey(TestModel, on_delete=models.DO_NOTHING)
 
+    class Meta:
+        managed = False
+        db_tablespace = 'pg_default'
+        indexes = [
+            models.Index(fields=['model', '-id'], name='viewtest_mrvwi_model'),
+            BrinIndex(fields=['id'], name='viewtest_mrvwi_id_brin'),
+        ]
+
 
 class CustomSchemaView(view.ReadOnlyView):
     sql = """SELECT id AS model_id, id FROM viewtest_testmodel"""
@@ -60,3 +73,37 @@ class CustomSchemaView(view.ReadOnlyView):
     class Meta:
         managed = False
         db_table = 'test_schema.my_custom_view'
+
+
+class TestModelSnapshot(snapshot.SnapshotView):
+    key = ['id']
+    sql = """SELECT id, name FROM viewtest_testmodel"""
+
+    id = models.IntegerField(primary_key=True)
+    name = models.CharField(max_length=100)
+
+
+
+class MaterializedRelatedSnapshot(snapshot.SnapshotView):
+    dependencies = ('viewtest.MaterializedRelatedView',)
+    key = ['id']
+    sql = """SELECT id, model_id FROM viewtest_materializedrelatedview"""
+
+    id = models.IntegerField(primary_key=True)
+    model_id = models.IntegerField()
+
+class TestModelSummary(aggregate.AggregateView):
+    source = 'viewtest.TestModel'
+    group_by = ['name']
+    measures = {
+        'total': aggregate.Count(),
+        'id_sum': aggregate.Sum('id'),
+        'first_id': aggregate.Min('id'),
+        'last_id': aggregate.Max('id'),
+    }
+
+    name = models.CharField(max_length=100, primary_key=True)
+    total = models.BigIntegerField()
+    id_sum = models.BigIntegerField()
+    first_id = models.IntegerField()
+    last_id = models.IntegerField()
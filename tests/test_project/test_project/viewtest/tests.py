@@ -1,22 +1,49 @@
 """Test Django PGViews.
 """
+import asyncio
 from contextlib import closing
+import time
 
 from django.contrib import auth
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management import call_command
-from django.db import connection
-from django.db.models import signals
+from django.db import (
+    OperationalError, connection, connections, transaction)
+from django.db.models import Max, signals
 from django.dispatch import receiver
-from django.test import TestCase
-from django_pgviews.signals import view_synced, all_views_synced
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings)
+from django_pgviews.aio import arefresh, arefresh_views
+from django_pgviews.cache import CachedViewQuerySet, get_cache
+from django_pgviews.databases import run_on_databases
+from django_pgviews.db.batch import RecordingBatch, StatementBatch
+from django_pgviews.db.timeouts import lock_not_available
+from django_pgviews.graph import (
+    CyclicDependencyError, MissingDependencyError, UnknownViewError,
+    ViewGraph, get_view_models)
+from django_pgviews import view
+from django_pgviews.introspection import (
+    Column, ViewState, columns_compatible, get_view_states)
+from django_pgviews.locks import SYNC_LOCK, get_lock_mode, view_lock
+from django_pgviews.lookup import close_listeners
+from django_pgviews.models import ViewSyncer
+from django_pgviews.refresh import refresh_views
+from django_pgviews.refresher import (
+    NOTIFY_FUNCTION, NOTIFY_TRIGGER, Refresher)
+from django_pgviews.signals import (
+    view_refreshed, view_synced, all_views_synced)
+from django_pgviews.tracing import Tracer
+from django_pgviews.view import (
+    ExclusiveRefreshError, Maintenance, ViewNotPopulatedError, storage_clause,
+    view_fingerprint)
 
 from . import models
 
 
 @receiver(signals.post_migrate)
-def create_test_schema(sender, app_config, **kwargs):
+def create_test_schema(sender, app_config, using='default', **kwargs):
     command = 'CREATE SCHEMA IF NOT EXISTS {};'.format('test_schema')
-    with connection.cursor() as cursor:
+    with connections[using].cursor() as cursor:
         cursor.execute(command)
 
 
@@ -122,11 +149,29 @@ class ViewTestCase(TestCase):
             models.MaterializedRelatedViewWithIndex.objects.count(), 1,
             'Materialized view should have updated concurrently')
 
+    def test_materialized_view_indexes(self):
+        """Materialized views get the indexes from their Meta.indexes.
+        """
+        with closing(connection.cursor()) as cur:
+            cur.execute(
+                """SELECT indexname, indexdef FROM pg_indexes
+                WHERE tablename = 'viewtest_materializedrelatedviewwithindex'
+                ORDER BY indexname;""")
+            indexes = dict(cur.fetchall())
+
+        self.assertEqual(sorted(indexes), [
+            'viewtest_materializedrelatedviewwithindex_id_index',
+            'viewtest_mrvwi_id_brin',
+            'viewtest_mrvwi_model',
+        ])
+        self.assertIn('USING brin', indexes['viewtest_mrvwi_id_brin'])
+        self.assertIn('id DESC', indexes['viewtest_mrvwi_model'])
+
     def test_signals(self):
         expected = {
             models.MaterializedRelatedView: {
-                'status': 'CREATED',
-                'has_changed': True,
+                'status': 'EXISTS',
+                'has_changed': False,
             },
             models.Superusers: {
                 'status': 'EXISTS',
@@ -139,11 +184,12 @@ class ViewTestCase(TestCase):
         @receiver(view_synced)
         def on_view_synced(sender, **kwargs):
             synced_views.append(sender)
+            self.assertGreaterEqual(kwargs.pop('duration'), 0)
             if sender in expected:
                 expected_kwargs = expected.pop(sender)
                 self.assertEqual(
-                    dict(expected_kwargs,
-                         update=False, force=False, signal=view_synced),
+                    dict(expected_kwargs, update=False, force=False,
+                         using='default', signal=view_synced),
                     kwargs)
 
         @receiver(all_views_synced)
@@ -153,10 +199,966 @@ class ViewTestCase(TestCase):
         call_command('sync_pgviews', update=False)
 
         # All views went through syncing
-        self.assertEqual(len(synced_views), 8)
+        self.assertEqual(len(synced_views), 11)
         self.assertEqual(all_views_were_synced[0], True)
         self.assertFalse(expected)
 
+    def test_sync_selected_views(self):
+        """Only the selected views and their dependencies are synced.
+        """
+        synced_views = []
+
+        @receiver(view_synced)
+        def on_view_synced(sender, **kwargs):
+            synced_views.append(sender)
+
+        call_command('sync_pgviews', 'viewtest.dependantview', upstream=True)
+        self.assertEqual(synced_views,
+                         [models.RelatedView, models.DependantView])
+
+
+    def test_unchanged_views_are_skipped(self):
+        """Syncing views whose definition has not changed leaves them alone.
+        """
+        test_model = models.TestModel()
+        test_model.name = "Bob"
+        test_model.save()
+        models.MaterializedRelatedView.refresh()
+
+        models.TestModel.objects.create(name="Alice")
+
+        statuses = {}
+
+        @receiver(view_synced)
+        def on_view_synced(sender, **kwargs):
+            statuses[sender] = (kwargs['status'], kwargs['has_changed'])
+
+        call_command('sync_pgviews', force=True)
+
+        self.assertEqual(len(statuses), 11)
+        for view_cls, status in statuses.items():
+            self.assertEqual(status, ('UNCHANGED', False), view_cls)
+
+        # The materialized view was not rebuilt, so it has not picked up the
+        # new row.
+        self.assertEqual(models.MaterializedRelatedView.objects.count(), 1)
+
+
+class AggregateViewTestCase(TestCase):
+    def assertSummary(self, expected):
+        self.assertEqual(
+            list(models.TestModelSummary.objects.order_by('name').values_list(
+                'name', 'total', 'id_sum', 'first_id', 'last_id')),
+            expected)
+
+    def test_incremental_maintenance(self):
+        """The summary table follows changes to the source table.
+        """
+        self.assertSummary([])
+
+        bob = models.TestModel.objects.create(name="Bob")
+        bob2 = models.TestModel.objects.create(name="Bob")
+        alice = models.TestModel.objects.create(name="Alice")
+        self.assertSummary([
+            ('Alice', 1, alice.id, alice.id, alice.id),
+            ('Bob', 2, bob.id + bob2.id, bob.id, bob2.id),
+        ])
+
+        models.TestModel.objects.filter(id=bob2.id).update(name="Alice")
+        self.assertSummary([
+            ('Alice', 2, alice.id + bob2.id, bob2.id, alice.id),
+            ('Bob', 1, bob.id, bob.id, bob.id),
+        ])
+
+        bob.delete()
+        self.assertSummary([
+            ('Alice', 2, alice.id + bob2.id, bob2.id, alice.id),
+        ])
+
+        models.TestModel.objects.all().delete()
+        self.assertSummary([])
+
+    def test_refresh(self):
+        """The summary can be recomputed from scratch.
+        """
+        bob = models.TestModel.objects.create(name="Bob")
+        with closing(connection.cursor()) as cur:
+            cur.execute("DELETE FROM viewtest_testmodelsummary;")
+        self.assertSummary([])
+
+        models.TestModelSummary.refresh()
+        self.assertSummary([('Bob', 1, bob.id, bob.id, bob.id)])
+
+    def test_rebuild_keeps_dependants(self):
+        """Views reading from a rebuilt summary table are recreated.
+        """
+        with closing(connection.cursor()) as cur:
+            cur.execute(
+                """CREATE VIEW viewtest_summary_names AS
+                SELECT name FROM viewtest_testmodelsummary;""")
+            cur.execute(
+                "COMMENT ON TABLE viewtest_testmodelsummary IS NULL;")
+
+        call_command('sync_pgviews', 'viewtest.testmodelsummary')
+
+        models.TestModel.objects.create(name="Bob")
+        with closing(connection.cursor()) as cur:
+            cur.execute("SELECT name FROM viewtest_summary_names;")
+            self.assertEqual(cur.fetchall(), [('Bob',)])
+
+
+class SnapshotViewTestCase(TestCase):
+    def assertSnapshot(self, expected):
+        self.assertEqual(
+            list(models.TestModelSnapshot.objects.order_by('id').values_list(
+                'id', 'name')),
+            expected)
+
+    def row_version(self, pk):
+        with closing(connection.cursor()) as cur:
+            cur.execute(
+                "SELECT ctid::text FROM viewtest_testmodelsnapshot "
+                "WHERE id = %s;", [pk])
+            return cur.fetchone()[0]
+
+    def test_refresh(self):
+        """Only the rows that changed are written.
+        """
+        bob = models.TestModel.objects.create(name="Bob")
+        alice = models.TestModel.objects.create(name="Alice")
+        self.assertSnapshot([])
+
+        self.assertEqual(models.TestModelSnapshot.refresh(), 2)
+        self.assertSnapshot([(bob.id, 'Bob'), (alice.id, 'Alice')])
+        alice_version = self.row_version(alice.id)
+
+        models.TestModel.objects.filter(id=bob.id).update(name="Robert")
+        carol = models.TestModel.objects.create(name="Carol")
+        self.assertIsNone(models.TestModelSnapshot.refresh(
+            where='id = %s', params=[bob.id]))
+        self.assertSnapshot([(bob.id, 'Robert'), (alice.id, 'Alice')])
+        # Unchanged rows are left alone.
+        self.assertEqual(self.row_version(alice.id), alice_version)
+
+        alice.delete()
+        models.TestModelSnapshot.refresh()
+        self.assertSnapshot([(bob.id, 'Robert'), (carol.id, 'Carol')])
+
+        models.TestModel.objects.all().delete()
+        self.assertEqual(models.TestModelSnapshot.refresh(), 0)
+        self.assertSnapshot([])
+
+
+class IntrospectionTestCase(TestCase):
+    def test_get_view_states(self):
+        """The state of every view is loaded in one query.
+        """
+        names = [
+            'viewtest_relatedview',
+            'viewtest_materializedrelatedview',
+            'test_schema.my_custom_view',
+            'viewtest_doesnotexist',
+        ]
+        with connection.cursor() as cursor:
+            states = get_view_states(cursor, names)
+
+        self.assertEqual(set(states), set(names[:3]))
+        self.assertEqual(states['viewtest_relatedview'].kind, 'v')
+        self.assertEqual(
+            states['viewtest_materializedrelatedview'].kind, 'm')
+        self.assertEqual(
+            [c.name for c in states['test_schema.my_custom_view'].columns],
+            ['model_id', 'id'])
+        self.assertTrue(
+            states['viewtest_relatedview'].comment.startswith(
+                'django_pgviews:'))
+
+    def test_conflicting_schema_requires_force(self):
+        """Incompatible columns are detected from the catalog.
+        """
+        with closing(connection.cursor()) as cur:
+            cur.execute("DROP VIEW viewtest_relatedview CASCADE;")
+            cur.execute(
+                """CREATE VIEW viewtest_relatedview as
+                SELECT id AS model_id, name FROM viewtest_testmodel;""")
+
+        statuses = {}
+
+        @receiver(view_synced)
+        def on_view_synced(sender, **kwargs):
+            statuses[sender] = kwargs['status']
+
+        call_command('sync_pgviews')
+
+        self.assertEqual(statuses[models.RelatedView], 'FORCE_REQUIRED')
+        self.assertEqual(statuses[models.DependantView], 'CREATED')
+
+    def test_atomic_sync(self):
+        """Views can all be synced in one batched transaction.
+        """
+        with closing(connection.cursor()) as cur:
+            cur.execute("DROP VIEW viewtest_relatedview CASCADE;")
+            cur.execute(
+                """CREATE VIEW viewtest_relatedview as
+                SELECT id AS model_id, name FROM viewtest_testmodel;""")
+
+        statuses = {}
+
+        @receiver(view_synced)
+        def on_view_synced(sender, **kwargs):
+            statuses[sender] = kwargs['status']
+
+        call_command('sync_pgviews', force=True, atomic=True)
+
+        self.assertEqual(len(statuses), 11)
+        self.assertEqual(statuses[models.RelatedView], 'FORCED')
+        self.assertEqual(statuses[models.DependantView], 'CREATED')
+        self.assertEqual(statuses[models.Superusers], 'UNCHANGED')
+
+    def test_atomic_force_changes_column_modifiers(self):
+        """An atomic, forced sync replaces views whose column types only
+        differ by their modifiers, like a plain forced sync.
+        """
+        with closing(connection.cursor()) as cur:
+            cur.execute("DROP VIEW viewtest_simpleuser;")
+            cur.execute(
+                """CREATE VIEW viewtest_simpleuser AS
+                SELECT username::varchar(10) AS username, password,
+                row_number() OVER () AS id FROM auth_user;""")
+
+        statuses = {}
+
+        @receiver(view_synced)
+        def on_view_synced(sender, **kwargs):
+            statuses[sender] = kwargs['status']
+
+        call_command('sync_pgviews', force=True, atomic=True)
+
+        self.assertEqual(statuses[models.SimpleUser], 'FORCED')
+        self.assertEqual(statuses[models.RelatedView], 'UNCHANGED')
+
+    def test_atomic_sync_is_all_or_nothing(self):
+        """A failure part way through an atomic sync changes nothing.
+        """
+        with closing(connection.cursor()) as cur:
+            cur.execute("DROP VIEW viewtest_relatedview CASCADE;")
+            cur.execute(
+                """CREATE VIEW viewtest_relatedview as
+                SELECT id AS model_id, name FROM viewtest_testmodel;""")
+
+        synced_views = []
+
+        @receiver(view_synced)
+        def on_view_synced(sender, **kwargs):
+            synced_views.append(sender)
+
+        sql = models.DependantView.sql
+        models.DependantView.sql = 'SELECT missing FROM viewtest_relatedview;'
+        try:
+            with self.assertRaises(Exception):
+                call_command('sync_pgviews', force=True, atomic=True)
+        finally:
+            models.DependantView.sql = sql
+
+        self.assertEqual(synced_views, [])
+        with closing(connection.cursor()) as cur:
+            cur.execute("SELECT name FROM viewtest_relatedview;")
+
+    def test_swap_materialized_views(self):
+        """Changed materialized views can be rebuilt and swapped in.
+        """
+        models.TestModel.objects.create(name="Bob")
+        with closing(connection.cursor()) as cur:
+            cur.execute(
+                """COMMENT ON MATERIALIZED VIEW
+                viewtest_materializedrelatedview IS NULL;""")
+            cur.execute(
+                """COMMENT ON MATERIALIZED VIEW
+                viewtest_materializedrelatedviewwithindex IS NULL;""")
+
+        statuses = {}
+
+        @receiver(view_synced)
+        def on_view_synced(sender, **kwargs):
+            statuses[sender] = kwargs['status']
+
+        call_command('sync_pgviews', swap=True)
+
+        self.assertEqual(statuses[models.MaterializedRelatedView], 'UPDATED')
+        self.assertEqual(
+            statuses[models.MaterializedRelatedViewWithIndex], 'UPDATED')
+        # Recreated along with the view it depends on.
+        self.assertEqual(
+            statuses[models.DependantMaterializedView], 'UNCHANGED')
+        self.assertEqual(models.MaterializedRelatedView.objects.count(), 1)
+        self.assertEqual(
+            models.DependantMaterializedView.objects.count(), 1)
+
+        with closing(connection.cursor()) as cur:
+            cur.execute(
+                """SELECT COUNT(*) FROM pg_indexes WHERE indexname =
+                'viewtest_materializedrelatedviewwithindex_id_index';""")
+            self.assertEqual(cur.fetchone()[0], 1)
+            cur.execute(
+                """SELECT COUNT(*) FROM pg_indexes WHERE indexname IN
+                ('viewtest_mrvwi_model', 'viewtest_mrvwi_id_brin');""")
+            self.assertEqual(cur.fetchone()[0], 2)
+            cur.execute(
+                """SELECT COUNT(*) FROM pg_class
+                WHERE relname LIKE '%pgviews_new';""")
+            self.assertEqual(cur.fetchone()[0], 0)
+
+
+class StatementBatchTestCase(SimpleTestCase):
+    class FakeCursor(object):
+        def __init__(self):
+            self.executed = []
+
+        def execute(self, sql, params=None):
+            self.executed.append(sql)
+
+    def test_deferred(self):
+        cursor = self.FakeCursor()
+        batch = StatementBatch(cursor, deferred=True)
+        batch.execute('CREATE VIEW a AS SELECT 1;')
+        batch.execute('CREATE VIEW b AS SELECT 2 -- two')
+        self.assertEqual(cursor.executed, [])
+
+        batch.flush()
+        self.assertEqual(cursor.executed, [
+            'CREATE VIEW a AS SELECT 1\n;\nCREATE VIEW b AS SELECT 2 -- two\n;'])
+        batch.flush()
+        self.assertEqual(len(cursor.executed), 1)
+
+    def test_immediate(self):
+        cursor = self.FakeCursor()
+        batch = StatementBatch(cursor)
+        batch.execute('CREATE VIEW a AS SELECT 1;')
+        self.assertEqual(cursor.executed, ['CREATE VIEW a AS SELECT 1;'])
+
+    def test_execute_now(self):
+        cursor = self.FakeCursor()
+        batch = StatementBatch(cursor, deferred=True)
+        batch.execute('CREATE VIEW a AS SELECT 1;')
+        batch.execute_now('CREATE VIEW b AS SELECT 2;')
+        self.assertEqual(cursor.executed, [
+            'CREATE VIEW a AS SELECT 1\n;', 'CREATE VIEW b AS SELECT 2;'])
+
+        cursor = self.FakeCursor()
+        batch = RecordingBatch(cursor)
+        batch.execute_now('CREATE VIEW b AS SELECT 2;')
+        self.assertEqual(cursor.executed, [])
+        self.assertEqual(batch.statements, ['CREATE VIEW b AS SELECT 2'])
+
+
+class FingerprintTestCase(SimpleTestCase):
+    def test_view_fingerprint(self):
+        self.assertEqual(view_fingerprint('SELECT 1;'),
+                         view_fingerprint('\n  SELECT 1 ;\n'))
+        self.assertNotEqual(view_fingerprint("SELECT 'a  b'"),
+                            view_fingerprint("SELECT 'a b'"))
+        self.assertNotEqual(
+            view_fingerprint('SELECT 1 -- one\n+ 1'),
+            view_fingerprint('SELECT 1 -- one + 1'))
+
+
+class ColumnsCompatibleTestCase(SimpleTestCase):
+    def test_columns_compatible(self):
+        old = [Column('id', 23, -1), Column('name', 25, -1)]
+        self.assertTrue(columns_compatible(old, [
+            Column('id', 23, None), Column('name', 25, None)]))
+        self.assertTrue(columns_compatible(old, [
+            Column('id', 23, None), Column('name', 25, None),
+            Column('extra', 25, None)]))
+        self.assertFalse(columns_compatible(old, [Column('id', 23, None)]))
+        self.assertFalse(columns_compatible(old, [
+            Column('name', 25, None), Column('id', 23, None)]))
+        self.assertFalse(columns_compatible(old, [
+            Column('id', 20, None), Column('name', 25, None)]))
+
+
+class MaintenanceTestCase(SimpleTestCase):
+    def test_statements(self):
+        maintenance = Maintenance(
+            analyze={'name': 500}, cluster='by_name', prewarm=True)
+        self.assertEqual(
+            [action for action, sql in maintenance.statements(
+                connection, 'viewtest_names', prewarm=True)],
+            ['cluster', 'statistics', 'analyze', 'prewarm'])
+        self.assertEqual(maintenance.statements(
+            connection, 'viewtest_names', prewarm=False,
+            cluster_index='by_name__pgviews_new')[:3], [
+            ('cluster',
+             'CLUSTER viewtest_names USING "by_name__pgviews_new";'),
+            ('statistics',
+             'ALTER MATERIALIZED VIEW viewtest_names ALTER COLUMN "name" '
+             'SET STATISTICS 500;'),
+            ('analyze', 'ANALYZE viewtest_names;'),
+        ])
+        self.assertFalse(Maintenance())
+        self.assertEqual(
+            Maintenance(analyze=True).statements(connection, 'v', False),
+            [('analyze', 'ANALYZE v;')])
+
+
+class StorageTestCase(SimpleTestCase):
+    def test_storage_clause(self):
+        self.assertEqual(storage_clause(connection), '')
+        self.assertEqual(
+            storage_clause(connection, {
+                'fillfactor': 90, 'autovacuum_enabled': False}, 'fast'),
+            ' WITH (autovacuum_enabled=false, fillfactor=90) '
+            'TABLESPACE "fast"')
+
+    def test_alter_storage(self):
+        state = ViewState(
+            name='viewtest_names', kind='m', columns=[], definition='',
+            comment='', populated=True,
+            options=['fillfactor=70', 'autovacuum_enabled=false'],
+            tablespace='pg_default')
+        self.assertEqual(view._alter_storage(
+            connection, 'viewtest_names', state, None, None), [])
+        self.assertEqual(view._alter_storage(
+            connection, 'viewtest_names', state,
+            {'fillfactor': 70, 'autovacuum_enabled': False}, 'pg_default'),
+            [])
+        self.assertEqual(view._alter_storage(
+            connection, 'viewtest_names', state, {'fillfactor': 90}, 'fast'), [
+            'ALTER MATERIALIZED VIEW viewtest_names '
+            'RESET (autovacuum_enabled);',
+            'ALTER MATERIALIZED VIEW viewtest_names SET (fillfactor=90);',
+            'ALTER MATERIALIZED VIEW viewtest_names SET TABLESPACE "fast";',
+        ])
+
+
+class StorageSyncTestCase(TestCase):
+    def get_reloptions(self):
+        with closing(connection.cursor()) as cur:
+            cur.execute(
+                """SELECT reloptions FROM pg_class WHERE oid = %s::regclass;""",
+                [models.MaterializedRelatedViewWithIndex._meta.db_table])
+            return cur.fetchone()[0]
+
+    def test_storage_drift_is_altered(self):
+        """Storage changed by hand is restored by the next sync.
+        """
+        self.assertEqual(self.get_reloptions(), ['fillfactor=70'])
+        with closing(connection.cursor()) as cur:
+            cur.execute(
+                """ALTER MATERIALIZED VIEW
+                viewtest_materializedrelatedviewwithindex
+                SET (fillfactor=50, autovacuum_enabled=false);""")
+
+        statuses = {}
+
+        @receiver(view_synced)
+        def on_view_synced(sender, **kwargs):
+            statuses[sender] = kwargs['status']
+
+        call_command('sync_pgviews')
+
+        self.assertEqual(
+            statuses[models.MaterializedRelatedViewWithIndex], 'ALTERED')
+        self.assertEqual(statuses[models.MaterializedRelatedView], 'UNCHANGED')
+        self.assertEqual(self.get_reloptions(), ['fillfactor=70'])
+
+
+class RefreshViewsTestCase(TestCase):
+    def test_refresh_pgviews(self):
+        """All materialized views are refreshed, dependencies first.
+        """
+        models.TestModel.objects.create(name="Bob")
+
+        call_command('refresh_pgviews')
+
+        self.assertEqual(models.MaterializedRelatedView.objects.count(), 1)
+        self.assertEqual(
+            models.MaterializedRelatedViewWithIndex.objects.count(), 1)
+        self.assertEqual(
+            models.DependantMaterializedView.objects.count(), 1)
+
+
+class CachedViewQuerySetTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+
+    def test_cached_until_refreshed(self):
+        """Results are cached until the view is refreshed.
+        """
+        queryset = CachedViewQuerySet(models.MaterializedRelatedView)
+        models.TestModel.objects.create(name="Bob")
+        models.MaterializedRelatedView.refresh()
+
+        # Each query is only run the first time round.
+        with self.assertNumQueries(5):
+            for i in range(2):
+                self.assertEqual(queryset.all().count(), 1)
+                self.assertEqual(len(queryset.all()), 1)
+                self.assertEqual(
+                    queryset.values_list('model_id', flat=True).count(), 1)
+                self.assertEqual(
+                    queryset.aggregate(Max('id'))['id__max'],
+                    queryset.get().id)
+
+        models.TestModel.objects.create(name="Alice")
+        with self.assertNumQueries(0):
+            self.assertEqual(queryset.all().count(), 1)
+
+        models.MaterializedRelatedView.refresh()
+        self.assertEqual(queryset.all().count(), 2)
+        self.assertEqual(len(queryset.filter(model__name="Alice")), 1)
+
+
+class CacheSettingTestCase(SimpleTestCase):
+    @override_settings(
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'dummy': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        })
+    def test_process_local_cache(self):
+        """Caches not shared between processes are rejected.
+        """
+        for alias in ('default', 'dummy'):
+            with override_settings(PGVIEWS_CACHE=alias):
+                with self.assertRaises(ImproperlyConfigured):
+                    get_cache()
+
+
+class LookupTableTestCase(TransactionTestCase):
+    def tearDown(self):
+        close_listeners()
+        models.TestModel.objects.all().delete()
+        call_command('refresh_pgviews')
+
+    def test_lookup(self):
+        """Rows are looked up in memory until the view is refreshed.
+        """
+        bob = models.TestModel.objects.create(name="Bob")
+        models.MaterializedRelatedView.refresh()
+        lookup = models.MaterializedRelatedView.lookup
+
+        self.assertEqual(lookup.get(bob.pk).model_id, bob.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(lookup.get(str(bob.pk)).pk, bob.pk)
+            self.assertEqual(
+                [row.pk for row in lookup.filter([0, bob.pk])], [bob.pk])
+            self.assertEqual(len(lookup), 1)
+            with self.assertRaises(models.MaterializedRelatedView.DoesNotExist):
+                lookup.get(0)
+
+        alice = models.TestModel.objects.create(name="Alice")
+        self.assertNotIn(alice.pk, lookup)
+        models.MaterializedRelatedView.refresh()
+
+        # Notifications arrive asynchronously.
+        deadline = time.monotonic() + 5
+        while alice.pk not in lookup and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(lookup.get(alice.pk).model_id, alice.pk)
+
+
+class RecordingTracer(Tracer):
+    spans = []
+
+    def end_span(self, span, exc=None):
+        self.spans.append(span)
+
+
+@override_settings(
+    PGVIEWS_TRACER='test_project.viewtest.tests.RecordingTracer')
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        del RecordingTracer.spans[:]
+
+    def test_view_refreshed(self):
+        """Refreshes are timed, traced and seen by execute wrappers.
+        """
+        refreshed = []
+        statements = []
+
+        @receiver(view_refreshed)
+        def on_view_refreshed(sender, **kwargs):
+            refreshed.append((sender, kwargs['concurrently']))
+            self.assertGreaterEqual(kwargs['duration'], 0)
+
+        def wrapper(execute, sql, params, many, context):
+            statements.append(sql)
+            return execute(sql, params, many, context)
+
+        models.TestModel.objects.create(name="Bob")
+        with connection.execute_wrapper(wrapper):
+            rows = models.MaterializedRelatedViewWithIndex.refresh(
+                concurrently=True)
+
+        self.assertEqual(rows, 1)
+        self.assertEqual(
+            refreshed, [(models.MaterializedRelatedViewWithIndex, True)])
+        self.assertEqual(statements, [
+            'REFRESH MATERIALIZED VIEW CONCURRENTLY '
+            'viewtest_materializedrelatedviewwithindex;\n'
+            'SELECT count(*) FROM viewtest_materializedrelatedviewwithindex;'])
+        span, = RecordingTracer.spans
+        self.assertEqual(span.name, 'pgviews.refresh')
+        self.assertEqual(
+            span.attributes['view'],
+            'viewtest_materializedrelatedviewwithindex')
+        self.assertEqual(span.attributes['rows'], 1)
+        self.assertGreaterEqual(span.duration, 0)
+
+    def test_refresh_options(self):
+        """Timeouts only last for the refresh, and strict refreshes never
+        lock readers out.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW lock_timeout;')
+            lock_timeout = cursor.fetchone()[0]
+
+        models.MaterializedRelatedView.refresh(
+            lock_timeout=0.5, statement_timeout=10, retries=2)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW lock_timeout;')
+            self.assertEqual(cursor.fetchone()[0], lock_timeout)
+        span, = RecordingTracer.spans
+        self.assertEqual(span.attributes['attempts'], 1)
+        with self.assertRaises(ExclusiveRefreshError):
+            models.MaterializedRelatedView.refresh(
+                concurrently=True, strict=True)
+
+    def test_refresh_retries(self):
+        """Refreshes that can't get their lock in time are retried, then
+        fail.
+        """
+        refreshed = []
+
+        @receiver(view_refreshed)
+        def on_view_refreshed(sender, **kwargs):
+            refreshed.append(sender)
+
+        other = connection.get_new_connection(
+            connection.get_connection_params())
+        try:
+            with other.cursor() as cursor:
+                # Readers hold a lock an exclusive refresh has to wait for,
+                # until their transaction ends.
+                cursor.execute(
+                    'SELECT 1 FROM viewtest_materializedrelatedview;')
+            with self.assertLogs('django_pgviews.view', 'WARNING') as logs, \
+                    self.assertRaises(OperationalError) as caught:
+                models.MaterializedRelatedView.refresh(
+                    lock_timeout=0.05, retries=2, backoff=0.01)
+        finally:
+            other.close()
+
+        self.assertTrue(lock_not_available(caught.exception))
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(refreshed, [])
+
+    def test_strict_refresh(self):
+        """Strict refreshes run concurrently, never waiting for readers.
+        """
+        view_cls = models.MaterializedRelatedViewWithIndex
+        refreshed = []
+
+        @receiver(view_refreshed)
+        def on_view_refreshed(sender, **kwargs):
+            refreshed.append(kwargs['concurrently'])
+
+        other = connection.get_new_connection(
+            connection.get_connection_params())
+        try:
+            with other.cursor() as cursor:
+                cursor.execute(
+                    'SELECT 1 FROM viewtest_materializedrelatedviewwithindex;')
+            with self.assertRaises(ExclusiveRefreshError):
+                view_cls.refresh(strict=True)
+            view_cls.refresh(concurrently=True, strict=True, lock_timeout=1)
+        finally:
+            other.close()
+
+        self.assertEqual(refreshed, [True])
+
+    def test_aggregate_view_refreshed(self):
+        """Aggregate refreshes report their rows and lock wait.
+        """
+        models.TestModel.objects.create(name="Bob")
+        models.TestModel.objects.create(name="Alice")
+
+        self.assertEqual(models.TestModelSummary.refresh(), 2)
+
+        span, = RecordingTracer.spans
+        self.assertEqual(span.attributes['rows'], 2)
+        self.assertGreaterEqual(span.attributes['lock_wait'], 0)
+
+    def test_sync_spans(self):
+        """Syncing every view is traced, view by view.
+        """
+        call_command('sync_pgviews', update=False)
+
+        names = [span.name for span in RecordingTracer.spans]
+        self.assertEqual(names, ['pgviews.sync'] * 11 + ['pgviews.sync_views'])
+        self.assertEqual(
+            set(span.attributes.get('status')
+                for span in RecordingTracer.spans[:-1]),
+            set(['EXISTS']))
+
+
+class ParallelRefreshViewsTestCase(TransactionTestCase):
+    def tearDown(self):
+        models.TestModel.objects.all().delete()
+        call_command('refresh_pgviews')
+
+    def test_refresh_pgviews_workers(self):
+        """Views can be refreshed in parallel on separate connections.
+        """
+        models.TestModel.objects.create(name="Bob")
+        models.TestModel.objects.create(name="Alice")
+
+        call_command('refresh_pgviews', workers=4, concurrently=True)
+
+        self.assertEqual(models.MaterializedRelatedView.objects.count(), 2)
+        self.assertEqual(
+            models.MaterializedRelatedViewWithIndex.objects.count(), 2)
+        self.assertEqual(
+            models.DependantMaterializedView.objects.count(), 2)
+
+
+class AsyncRefreshViewsTestCase(TransactionTestCase):
+    def tearDown(self):
+        models.TestModel.objects.all().delete()
+        call_command('refresh_pgviews')
+
+    def test_arefresh_views(self):
+        """Views can be refreshed and read from asyncio code.
+        """
+        bob = models.TestModel.objects.create(name="Bob")
+
+        async def refresh_and_read():
+            refreshed = await arefresh_views(concurrently=True)
+            rows = [
+                row.model_id
+                async for row in models.MaterializedRelatedView.objects.all()]
+            return refreshed, rows
+
+        refreshed, rows = asyncio.get_event_loop().run_until_complete(
+            refresh_and_read())
+
+        self.assertEqual(set(refreshed), set([
+            models.MaterializedRelatedView,
+            models.MaterializedRelatedViewWithIndex,
+            models.DependantMaterializedView,
+            models.TestModelSnapshot,
+            models.MaterializedRelatedSnapshot,
+        ]))
+        self.assertEqual(rows, [bob.pk])
+
+
+class AsyncRefreshTestCase(SimpleTestCase):
+    def test_not_refreshable(self):
+        """Only materialized and snapshot views can be refreshed.
+        """
+        with self.assertRaises(TypeError):
+            asyncio.get_event_loop().run_until_complete(
+                arefresh(models.TestModelSummary))
+
+
+class AdvisoryLockTestCase(TestCase):
+    def test_skip_locked(self):
+        """Syncs and refreshes can skip work another process is doing.
+        """
+        other = connection.get_new_connection(
+            connection.get_connection_params())
+        try:
+            with other.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_lock(%s, %s);', SYNC_LOCK)
+                cursor.execute(
+                    'SELECT pg_advisory_lock(%s, %s);',
+                    view_lock(models.MaterializedRelatedView))
+            self.assertFalse(
+                ViewSyncer().run(force=True, update=True, lock='skip'))
+
+            refreshed = []
+
+            @receiver(view_refreshed)
+            def on_view_refreshed(sender, **kwargs):
+                refreshed.append(sender)
+
+            models.MaterializedRelatedView.refresh(lock='skip')
+            models.MaterializedRelatedViewWithIndex.refresh(lock='skip')
+            self.assertEqual(
+                refreshed, [models.MaterializedRelatedViewWithIndex])
+        finally:
+            other.close()
+
+        self.assertTrue(ViewSyncer().run(force=True, update=True, lock='skip'))
+
+    @override_settings(PGVIEWS_SYNC_LOCK='never')
+    def test_lock_modes(self):
+        self.assertEqual(get_lock_mode('PGVIEWS_REFRESH_LOCK'), False)
+        self.assertEqual(get_lock_mode('PGVIEWS_SYNC_LOCK', 'skip'), 'skip')
+        with self.assertRaises(ImproperlyConfigured):
+            get_lock_mode('PGVIEWS_SYNC_LOCK')
+
+
+class AllDatabasesTestCase(TransactionTestCase):
+    databases = {'default', 'other'}
+
+    def test_sync_all_databases(self):
+        """Views are synced on every Postgres database.
+        """
+        databases = []
+
+        @receiver(view_synced)
+        def on_view_synced(sender, **kwargs):
+            databases.append(kwargs['using'])
+
+        call_command('sync_pgviews', all_databases=True)
+
+        self.assertEqual(sorted(databases), ['default'] * 11 + ['other'] * 11)
+
+
+class NoViewsRouter(object):
+    def allow_migrate(self, db, app_label, **hints):
+        return app_label != 'viewtest'
+
+
+class DatabasesTestCase(SimpleTestCase):
+    def test_run_on_databases(self):
+        """Results and exceptions are collected for each database.
+        """
+        error = ValueError('no')
+
+        def fail(using):
+            raise error
+
+        self.assertEqual(
+            run_on_databases(lambda using: using.upper(), ['default']),
+            {'default': 'DEFAULT'})
+        self.assertEqual(run_on_databases(fail, ['default']), {'default': error})
+
+    @override_settings(
+        DATABASE_ROUTERS=['test_project.viewtest.tests.NoViewsRouter'])
+    def test_routers(self):
+        """Only views the routers allow on a database are synced there.
+        """
+        self.assertEqual(get_view_models('default'), [])
+        self.assertEqual(len(get_view_models()), 11)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RefresherTestCase(TestCase):
+    def test_install(self):
+        """Source tables are found and get NOTIFY triggers.
+        """
+        refresher = Refresher()
+        with connection.cursor() as cursor:
+            refresher.install(cursor)
+            cursor.execute(
+                """SELECT tgrelid::regclass::text FROM pg_trigger
+                WHERE tgname = %s;""", [NOTIFY_TRIGGER])
+            self.assertEqual(cursor.fetchall(), [('viewtest_testmodel',)])
+            cursor.execute(
+                "SELECT 'viewtest_testmodel'::regclass::oid::bigint;")
+            oid, = cursor.fetchone()
+
+        self.assertEqual(refresher.sources[oid], set([
+            models.MaterializedRelatedView,
+            models.MaterializedRelatedViewWithIndex,
+        ]))
+
+    def test_remove_triggers(self):
+        """Triggers no view needs are removed on install, and all of them by
+        clear_pgviews.
+        """
+        def triggers():
+            cursor.execute(
+                """SELECT tgrelid::regclass::text FROM pg_trigger
+                WHERE tgname = %s;""", [NOTIFY_TRIGGER])
+            return cursor.fetchall()
+
+        with connection.cursor() as cursor:
+            Refresher().install(cursor)
+            cursor.execute(
+                'CREATE TRIGGER {0} AFTER INSERT ON auth_user '
+                'FOR EACH STATEMENT EXECUTE PROCEDURE {1}();'.format(
+                    NOTIFY_TRIGGER, NOTIFY_FUNCTION))
+            Refresher().install(cursor)
+            self.assertEqual(triggers(), [('viewtest_testmodel',)])
+
+            call_command('clear_pgviews')
+            self.assertEqual(triggers(), [])
+            cursor.execute('SELECT to_regproc(%s);', [NOTIFY_FUNCTION])
+            self.assertIsNone(cursor.fetchone()[0])
+
+
+class RefresherScheduleTestCase(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.refresher = Refresher(debounce=5, clock=self.clock)
+        self.refresher.sources[1] = set([models.MaterializedRelatedView])
+
+    def test_debounce(self):
+        """Views are refreshed once changes have settled, with dependents.
+        """
+        self.assertEqual(self.refresher.due_views(), [])
+
+        self.refresher.notify('1')
+        self.clock.now += 3
+        self.refresher.notify('1')
+        self.assertEqual(self.refresher.timeout(), 5)
+        self.clock.now += 4
+        self.assertEqual(self.refresher.due_views(), [])
+
+        self.clock.now += 1
+        self.assertEqual(self.refresher.due_views(), [
+            models.MaterializedRelatedView,
+            models.DependantMaterializedView,
+            models.MaterializedRelatedSnapshot,
+        ])
+
+    def test_due_at_time_zero(self):
+        self.clock.now = 0.0
+        refresher = Refresher(debounce=0, clock=self.clock)
+        refresher.sources[1] = set([models.MaterializedRelatedView])
+        refresher.notify('1')
+        self.assertEqual(
+            refresher.next_due(models.MaterializedRelatedView), 0)
+
+    def test_unknown_table(self):
+        self.refresher.notify('2')
+        self.clock.now += 10
+        self.assertEqual(self.refresher.due_views(), [])
+
+    def test_refresh_intervals(self):
+        """Minimum and maximum intervals bound when views are refreshed.
+        """
+        view_cls = models.MaterializedRelatedView
+        self.addCleanup(setattr, view_cls, '_min_refresh_interval', 0)
+        self.addCleanup(setattr, view_cls, '_max_refresh_interval', None)
+        view_cls._min_refresh_interval = 60
+        view_cls._max_refresh_interval = 600
+
+        self.refresher.notify('1')
+        self.clock.now += 10
+        self.assertNotIn(view_cls, self.refresher.due_views())
+        self.clock.now += 50
+        self.assertIn(view_cls, self.refresher.due_views())
+
+        self.refresher.pending.clear()
+        self.clock.now += 539
+        self.assertNotIn(view_cls, self.refresher.due_views())
+        self.clock.now += 1
+        self.assertIn(view_cls, self.refresher.due_views())
+
 
 class DependantViewTestCase(TestCase):
     def test_sync_depending_views(self):
@@ -236,3 +1238,203 @@ class DependantViewTestCase(TestCase):
                 cur.execute(
                     """SELECT name from
                     viewtest_dependantmaterializedview;""")
+
+
+    def test_rebuild_keeps_dependants(self):
+        """Views depending on a rebuilt view are recreated, synced or not.
+        """
+        models.TestModel.objects.create(name="Bob")
+        with closing(connection.cursor()) as cur:
+            cur.execute(
+                """CREATE VIEW viewtest_unmanagedview AS
+                SELECT model_id FROM viewtest_dependantmaterializedview;""")
+            cur.execute(
+                """COMMENT ON MATERIALIZED VIEW
+                viewtest_materializedrelatedview IS NULL;""")
+
+        statuses = {}
+
+        @receiver(view_synced)
+        def on_view_synced(sender, **kwargs):
+            statuses[sender] = kwargs['status']
+
+        call_command('sync_pgviews')
+
+        self.assertEqual(statuses[models.MaterializedRelatedView], 'UPDATED')
+        # Unchanged, so recreated as it was rather than synced again.
+        self.assertEqual(
+            statuses[models.DependantMaterializedView], 'UNCHANGED')
+        with closing(connection.cursor()) as cur:
+            cur.execute('SELECT COUNT(*) FROM viewtest_unmanagedview;')
+            self.assertEqual(cur.fetchone()[0], 1)
+
+            cur.execute(
+                """COMMENT ON MATERIALIZED VIEW
+                viewtest_materializedrelatedview IS NULL;""")
+            cur.execute(
+                """COMMENT ON MATERIALIZED VIEW
+                viewtest_dependantmaterializedview IS NULL;""")
+
+        call_command('sync_pgviews', atomic=True)
+
+        # Changed, so left for its own sync.
+        self.assertEqual(
+            statuses[models.DependantMaterializedView], 'CREATED')
+        with closing(connection.cursor()) as cur:
+            cur.execute('SELECT COUNT(*) FROM viewtest_unmanagedview;')
+            self.assertEqual(cur.fetchone()[0], 1)
+
+    def test_dry_run(self):
+        """A dry run reports the DDL a sync would run, without running it.
+        """
+        with closing(connection.cursor()) as cur:
+            cur.execute(
+                """COMMENT ON MATERIALIZED VIEW
+                viewtest_materializedrelatedview IS NULL;""")
+
+        planned = dict(
+            (view_cls, (status, statements, estimate))
+            for view_cls, status, statements, estimate
+            in ViewSyncer().dry_run(force=False, update=True))
+
+        self.assertEqual(
+            planned[models.RelatedView], ('UNCHANGED', [], None))
+        status, statements, estimate = planned[
+            models.MaterializedRelatedView]
+        self.assertEqual(status, 'UPDATED')
+        self.assertEqual(statements[:2], [
+            'DROP MATERIALIZED VIEW IF EXISTS '
+            'public.viewtest_dependantmaterializedview',
+            'DROP MATERIALIZED VIEW viewtest_materializedrelatedview',
+        ])
+        self.assertTrue(statements[2].startswith(
+            'CREATE MATERIALIZED VIEW viewtest_materializedrelatedview AS'))
+        self.assertEqual(len(estimate), 2)
+        # Recreated along with the view it depends on.
+        self.assertEqual(
+            planned[models.DependantMaterializedView][0], 'UNCHANGED')
+
+        with closing(connection.cursor()) as cur:
+            cur.execute(
+                """SELECT obj_description(
+                'viewtest_materializedrelatedview'::regclass, 'pg_class');""")
+            self.assertIsNone(cur.fetchone()[0])
+
+    def test_dry_run_reads_new_view(self):
+        """A changed view reading from a view not created yet is planned.
+        """
+        with closing(connection.cursor()) as cur:
+            cur.execute('DROP VIEW viewtest_relatedview CASCADE;')
+            cur.execute(
+                """CREATE VIEW viewtest_dependantview AS
+                SELECT id AS model_id FROM viewtest_testmodel;""")
+
+        planned = dict(
+            (view_cls, (status, statements))
+            for view_cls, status, statements, estimate
+            in ViewSyncer().dry_run(force=False, update=True))
+
+        self.assertEqual(planned[models.RelatedView][0], 'CREATED')
+        status, statements = planned[models.DependantView]
+        self.assertEqual(status, 'UPDATED')
+        self.assertTrue(statements[0].startswith(
+            'CREATE OR REPLACE VIEW viewtest_dependantview AS'))
+
+    def test_sync_without_data(self):
+        """Views synced without data fail clearly until populated.
+        """
+        models.TestModel.objects.create(name="Bob")
+        with closing(connection.cursor()) as cur:
+            cur.execute(
+                """COMMENT ON MATERIALIZED VIEW
+                viewtest_materializedrelatedview IS NULL;""")
+            cur.execute(
+                """COMMENT ON TABLE
+                viewtest_materializedrelatedsnapshot IS NULL;""")
+
+        call_command('sync_pgviews', '--no-data')
+
+        # Recreated without data too, as it reads from a view without any.
+        for view_cls in (models.MaterializedRelatedView,
+                         models.DependantMaterializedView):
+            with self.assertRaises(ViewNotPopulatedError), \
+                    transaction.atomic():
+                view_cls.objects.count()
+        # Readable, but empty.
+        self.assertEqual(models.MaterializedRelatedSnapshot.objects.count(), 0)
+
+        self.assertEqual(refresh_views(unpopulated=True), [
+            models.MaterializedRelatedView, models.DependantMaterializedView,
+            models.MaterializedRelatedSnapshot])
+        self.assertEqual(models.DependantMaterializedView.objects.count(), 1)
+        self.assertEqual(models.MaterializedRelatedSnapshot.objects.count(), 1)
+        self.assertEqual(refresh_views(unpopulated=True), [])
+
+
+def _stub_view(name, *dependencies):
+    """Build a minimal stand-in for a view class, for graph tests.
+    """
+    meta = type('Meta', (object,), {'app_label': 'stub'})
+    return type(name, (object,), {
+        '_meta': meta, '_dependencies': list(dependencies)})
+
+
+class ViewGraphTestCase(SimpleTestCase):
+    def test_installed_views_order(self):
+        """Dependencies are sorted before the views that need them.
+        """
+        graph = ViewGraph()
+        order = list(graph)
+        self.assertEqual(len(order), 11)
+        self.assertLess(order.index(models.RelatedView),
+                        order.index(models.DependantView))
+        self.assertLess(order.index(models.MaterializedRelatedView),
+                        order.index(models.DependantMaterializedView))
+        self.assertEqual(graph.depth['viewtest.DependantView'], 1)
+        self.assertEqual(graph.depth['viewtest.Superusers'], 0)
+
+    def test_levels(self):
+        a = _stub_view('A')
+        b = _stub_view('B', 'stub.A')
+        c = _stub_view('C', 'stub.A')
+        d = _stub_view('D', 'stub.B', 'stub.C')
+        graph = ViewGraph([d, c, b, a])
+        self.assertEqual(graph.levels, [[a], [c, b], [d]])
+        self.assertEqual(graph.order, [a, c, b, d])
+        self.assertEqual(graph.dependents['stub.A'], ['stub.C', 'stub.B'])
+
+    def test_select(self):
+        a = _stub_view('A')
+        b = _stub_view('B', 'stub.A')
+        c = _stub_view('C', 'stub.A')
+        d = _stub_view('D', 'stub.B')
+        graph = ViewGraph([a, b, c, d])
+        self.assertEqual(graph.select(['stub']), [a, b, c, d])
+        self.assertEqual(graph.select(['stub.b']), [b])
+        self.assertEqual(graph.select(['stub.B'], upstream=True), [a, b])
+        self.assertEqual(graph.select(['stub.B'], downstream=True), [b, d])
+        self.assertEqual(graph.select(['stub.D', 'stub.C'], upstream=True),
+                         [a, b, c, d])
+        with self.assertRaises(UnknownViewError) as ctx:
+            graph.select(['stub.A', 'other', 'stub.Nope'])
+        self.assertEqual(ctx.exception.labels, ['other', 'stub.Nope'])
+
+    def test_missing_dependency(self):
+        with self.assertRaises(MissingDependencyError) as ctx:
+            ViewGraph([_stub_view('A', 'stub.Nope')])
+        self.assertEqual(dict(ctx.exception.missing), {'stub.A': ['stub.Nope']})
+
+    def test_cycles(self):
+        views = [
+            _stub_view('A'),
+            _stub_view('B', 'stub.A', 'stub.D'),
+            _stub_view('C', 'stub.B'),
+            _stub_view('D', 'stub.C'),
+            _stub_view('E', 'stub.E'),
+        ]
+        with self.assertRaises(CyclicDependencyError) as ctx:
+            ViewGraph(views)
+        self.assertEqual(ctx.exception.cycles, [
+            ['stub.B', 'stub.D', 'stub.C'],
+            ['stub.E'],
+        ])